@@ -1,16 +1,23 @@
 from contextlib import asynccontextmanager
 import logging
 import asyncio
-from fastapi import FastAPI, HTTPException, UploadFile, File, Response
+from fastapi import FastAPI, HTTPException, UploadFile, File, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.background import BackgroundTask
+from langgraph.checkpoint.redis.aio import AsyncRedisSaver
 from enum import Enum
 import gc
+import tempfile
 import uuid
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import shutil
+import random
+import redis.asyncio as redis
 
 
 load_dotenv()
@@ -30,21 +37,63 @@ from service.data_models.onboarding import (
 from service.data_models.checklist import ChecklistAgentRequest
 from service.data_models.create_memory import CreateMemoryRequest
 from service.data_models.disaster_context import DisasterContextRequest
+from service.data_models.map_area import MapAreaRequest, MapAreaType
 from service.utils.constants import (
     VALID_PROMPT_KEYS,
     CACHED_MAP_RADIUS,
     CACHED_MAP_MIN_ZOOM_LEVEL,
     CACHED_MAP_MAX_ZOOM_LEVEL,
     WAIT_BETWEEN_RETRIES,
+    MIN_WAIT_BETWEEN_RETRIES,
+    MAP_AREA_MAX_EXTENT_MILES,
+    MAP_TILE_HTTP_MAX_AGE,
+    MEMORY_BATCH_WINDOW,
+    MEMORY_BATCH_MAX_MESSAGES,
+    MEMORY_BATCH_MAX_TOKENS,
+    MEMORY_EXTRACTION_CONCURRENCY,
+    MEMORY_COMPACTION_INTERVAL,
+    MEMORY_COMPACTION_THRESHOLD,
+    MEMORY_QUEUE_MAX_LENGTH,
+    MEMORY_QUEUE_CLAIM_IDLE,
+    MEMORY_QUEUE_BLOCK,
+    MEMORY_QUEUE_MAX_DELIVERIES,
+    MEMORY_QUEUE_RECLAIM_INTERVAL,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    MODEL_PING_INTERVAL,
+    COMM_AGENT_SYS_PROMPT_KEY,
+)
+from service.utils.environment import (
+    REDIS_HOST,
+    MEMORY_QUEUE_OVERFLOW_POLICY,
+    RESPONSE_CACHE_ENABLED,
+    OLLAMA_KEEP_ALIVE,
 )
 from service.utils.prompt_store import SystemPromptStore
+from service.utils.prompt_assembler import PromptAssembler
+from service.utils.memory_retriever import build_memory_context
+from service.utils.turn_timings import TurnTimings
 from service.utils.user_info_store import UserInfoStore
 from service.utils.memory_store import MemoryStore
+from service.utils.memory_batcher import MemoryBatcher
+from service.utils.memory_queue import (
+    DurableMemoryQueue,
+    MessageKind,
+    OverflowPolicy,
+)
+from service.utils.memory_compactor import MemoryCompactor
+from service.utils.response_cache import ResponseCache
 from service.utils.checklist_store import ChecklistStore
 from service.utils.nws_api import NWSApiFacade
 from service.utils.map_store import MapStore
 from service.utils.map_downloader import MapDownloader
+from service.utils.map_areas import build_map_area
+from service.utils.mbtiles import export_mbtiles, import_mbtiles, validate_mbtiles
 from service.agents.checklist_agent import ChecklistBuilderAgent
+from service.agents.comm_agent import create_chat_checkpointer
+from service.model import LangchainOllamaGemmaClient
+from service.model.model_warmer import ModelWarmer
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -62,35 +111,81 @@ class Mode(Enum):
 
 
 memory_agent: Optional[MemoryAgent] = None
-memory_queue: Optional[asyncio.Queue] = None
+memory_queue: Optional[DurableMemoryQueue] = None
+memory_batcher: Optional[MemoryBatcher] = None
 comm_agent: Optional[CommunicationAgent] = None
 voice_agent: Optional[VoiceCommunicationAgent] = None
 voice_memory_agent: Optional[VoiceMemoryAgent] = None
 onboarding_task: Optional[asyncio.Task] = None
+map_download_task: Optional[asyncio.Task] = None
 current_mode: Mode = Mode.TEXT
 disaster_context: Optional[DisasterContextRequest] = None
+response_cache: Optional[ResponseCache] = None
+model_warmer: Optional[ModelWarmer] = None
+chat_history_client: Optional[redis.Redis] = None
+chat_checkpointer: Optional[AsyncRedisSaver] = None
+
+
+def _response_cache_context(
+    frontend_tools: str, static_prefix: str, memory_info: str
+) -> str:
+    # Answers are only shared within the same disaster, phase and tools, and
+    # for the same profile and memories, which shape the answer as much. The
+    # cache hashes the whole context into its keys
+    if disaster_context is None:
+        disaster = "none"
+    else:
+        disaster = f"{disaster_context.disaster}\x00{disaster_context.phase}"
+    return "\x00".join([disaster, frontend_tools, static_prefix, memory_info])
+
+
+async def extract_memories(kind: MessageKind, user_messages: list[str]):
+    # The agent of the other mode is not loaded, the batch stays pending and
+    # is retried after a switch back, or dead-lettered in the end
+    if kind == MessageKind.TEXT:
+        if memory_agent is None:
+            raise RuntimeError("Text memory agent is not loaded")
+        await memory_agent.store_memories(user_messages)
+    else:
+        if voice_memory_agent is None:
+            raise RuntimeError("Voice memory agent is not loaded")
+        # The batcher never groups voice messages, this is a single file
+        for user_message in user_messages:
+            await voice_memory_agent.store_memory(user_message)
 
 
 async def memory_processor():
-    global memory_queue, memory_agent, voice_memory_agent
+    global memory_batcher
+
+    memory_batcher = MemoryBatcher(
+        memory_queue,
+        extract_memories,
+        window=MEMORY_BATCH_WINDOW,
+        max_batch_size=MEMORY_BATCH_MAX_MESSAGES,
+        max_batch_tokens=MEMORY_BATCH_MAX_TOKENS,
+        max_concurrency=MEMORY_EXTRACTION_CONCURRENCY,
+    )
+    try:
+        await memory_batcher.run()
+    except asyncio.CancelledError:
+        logging.error("Memory processor cancelled")
+
 
+async def memory_compactor():
     while True:
+        await asyncio.sleep(MEMORY_COMPACTION_INTERVAL)
         try:
-            user_message = await memory_queue.get()
-
-            if current_mode == Mode.TEXT:
-                asyncio.create_task(memory_agent.store_memory(user_message))
-            else:
-                asyncio.create_task(voice_memory_agent.store_memory(user_message))
-            memory_queue.task_done()
+            memories = await asyncio.to_thread(MemoryStore().list_memory)
+            if len(memories) >= MEMORY_COMPACTION_THRESHOLD:
+                await asyncio.to_thread(MemoryCompactor().compact)
         except asyncio.CancelledError:
-            logging.error("Memory processor cancelled")
-            break
+            raise
         except Exception as e:
-            logging.error(f"Error in memory processor: {e}")
+            logging.error(f"Error in memory compactor: {e}")
 
 
 async def map_downloader(lat: float, lon: float):
+    failures = 0
     while True:
         map_downloader = MapDownloader()
         result = await map_downloader.download_area(
@@ -105,10 +200,26 @@ async def map_downloader(lat: float, lon: float):
             logger.info("Download complete, existing map downloader coroutine.")
             break
         else:
+            # Exponential backoff with jitter, a flaky tile costs a minute,
+            # a server that stays down is asked at most every 15 minutes
+            failures += 1
+            wait = min(
+                MIN_WAIT_BETWEEN_RETRIES * 2 ** (failures - 1), WAIT_BETWEEN_RETRIES
+            )
+            wait = random.uniform(wait / 2, wait)
             logger.error(
-                f"Failed to complete download, retring in {WAIT_BETWEEN_RETRIES} seconds!"
+                f"Failed to complete download, retrying in {wait:.0f} seconds!"
             )
-            asyncio.sleep(WAIT_BETWEEN_RETRIES)
+            await asyncio.sleep(wait)
+
+
+def start_map_download(lat: float, lon: float) -> asyncio.Task:
+    global map_download_task
+
+    # A running download picks up newly queued areas before it finishes
+    if map_download_task is None or map_download_task.done():
+        map_download_task = asyncio.create_task(map_downloader(lat, lon))
+    return map_download_task
 
 
 async def checklist_builder(user_details: OnboardingRequest):
@@ -130,7 +241,7 @@ async def checklist_builder(user_details: OnboardingRequest):
 
 async def onboarding_tasks(onboarding_request: OnboardingRequest):
     await checklist_builder(onboarding_request)
-    await map_downloader(
+    await start_map_download(
         lat=onboarding_request.location.latitude,
         lon=onboarding_request.location.longitude,
     )
@@ -140,11 +251,39 @@ async def onboarding_tasks(onboarding_request: OnboardingRequest):
 async def lifespan(app: FastAPI):
     # Initialization
     global memory_agent, memory_queue, comm_agent, voice_agent, voice_memory_agent
+    global response_cache, model_warmer, chat_history_client, chat_checkpointer
     memory_agent = MemoryAgent()
-    comm_agent = CommunicationAgent()
-    memory_queue = asyncio.Queue(maxsize=1000)
+    chat_history_client = redis.Redis.from_url(REDIS_HOST)
+    chat_checkpointer = create_chat_checkpointer(chat_history_client)
+    comm_agent = CommunicationAgent(chat_checkpointer)
+    memory_queue = DurableMemoryQueue(
+        max_length=MEMORY_QUEUE_MAX_LENGTH,
+        overflow_policy=OverflowPolicy(MEMORY_QUEUE_OVERFLOW_POLICY),
+        claim_idle=MEMORY_QUEUE_CLAIM_IDLE,
+        block=MEMORY_QUEUE_BLOCK,
+        max_deliveries=MEMORY_QUEUE_MAX_DELIVERIES,
+    )
+
+    if RESPONSE_CACHE_ENABLED:
+        response_cache = ResponseCache(
+            ttl=RESPONSE_CACHE_TTL,
+            similarity=RESPONSE_CACHE_SIMILARITY,
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        )
+
+    # Loads the model in the background, /ready reports when it is resident
+    model_warmer = ModelWarmer(
+        model_id=LangchainOllamaGemmaClient.MODEL_ID,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        ping_interval=MODEL_PING_INTERVAL,
+    )
+    warm_up_task = asyncio.create_task(model_warmer.run())
 
     memory_task = asyncio.create_task(memory_processor())
+    reclaim_task = asyncio.create_task(
+        memory_queue.run_reclaimer(MEMORY_QUEUE_RECLAIM_INTERVAL)
+    )
+    compaction_task = asyncio.create_task(memory_compactor())
 
     is_god_mode = os.getenv("GOD_MODE") == "true"
     logger.info(
@@ -161,7 +300,7 @@ async def lifespan(app: FastAPI):
             logger.info(f"Cached (lat, lon) = ({lat}, {lon})")
             if (lat is not None and lon is not None) and (lat != 0.0 and lon != 0.0):
                 logger.info("Restart map downloader coroutine.")
-                asyncio.create_task(map_downloader(lat, lon))
+                start_map_download(lat, lon)
             else:
                 logger.info("No cached lat lon, giving up.")
     except:
@@ -176,6 +315,27 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
 
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+        try:
+            await warm_up_task
+        except asyncio.CancelledError:
+            pass
+
+    if reclaim_task and not reclaim_task.done():
+        reclaim_task.cancel()
+        try:
+            await reclaim_task
+        except asyncio.CancelledError:
+            pass
+
+    if compaction_task and not compaction_task.done():
+        compaction_task.cancel()
+        try:
+            await compaction_task
+        except asyncio.CancelledError:
+            pass
+
     if onboarding_task and not onboarding_task.done():
         onboarding_task.cancel()
         try:
@@ -183,9 +343,25 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
 
+    if map_download_task and not map_download_task.done():
+        map_download_task.cancel()
+        try:
+            await map_download_task
+        except asyncio.CancelledError:
+            pass
+
+    await memory_queue.close()
+    if response_cache:
+        await response_cache.close()
+    await chat_history_client.aclose()
+
     # Clean up
     memory_agent = None
     memory_queue = None
+    response_cache = None
+    model_warmer = None
+    chat_checkpointer = None
+    chat_history_client = None
     comm_agent = None
     voice_agent = None
     voice_memory_agent = None
@@ -198,6 +374,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Response-Cache"],
 )
 
 
@@ -211,17 +388,71 @@ async def generate_aprompt(request: PromptRequest):
             detail="Switch to text mode first using '/switch?mode='text''",
         )
 
-    prompt_with_tools = f"{request.frontendTools}\n\n{request.prompt}"
+    # Only standalone questions are shared, follow-ups depend on the history
+    # and are always generated
+    use_cache = response_cache is not None and response_cache.is_cacheable(
+        request.prompt
+    )
+    memory_info = None
+    if use_cache:
+        # Retrieved once, the key needs them and a miss generates with them
+        static_prefix, memory_info = await asyncio.gather(
+            asyncio.to_thread(
+                PromptAssembler().get_static_prefix, COMM_AGENT_SYS_PROMPT_KEY
+            ),
+            asyncio.to_thread(build_memory_context, query=request.prompt),
+        )
+        cache_context = _response_cache_context(
+            request.frontendTools, static_prefix, memory_info
+        )
+        cached = await response_cache.get(request.prompt, cache_context)
+        if cached is not None:
+
+            async def replay_chunks():
+                for chunk in cached:
+                    yield f"data: {chunk}\n\n"
+
+                await comm_agent.record_turn(request.prompt, "".join(cached))
+                await memory_queue.put(request.prompt, MessageKind.TEXT)
+
+            return StreamingResponse(
+                replay_chunks(),
+                media_type="text/event-stream",
+                headers={"X-Response-Cache": "hit"},
+            )
+
+    timings = TurnTimings()
+    chunks = comm_agent.generate(
+        request.prompt,
+        frontend_tools=request.frontendTools,
+        timings=timings,
+        memory_info=memory_info,
+    )
+    # Hold the headers back until the first token, so they carry the
+    # context, prompt and time-to-first-token durations. The total is only
+    # known once the stream ends and goes to the logs
+    first_chunk = await anext(chunks, None)
 
     async def generate_chunks():
-        full_response = []
-        async for chunk in comm_agent.generate(prompt_with_tools):
+        full_response = [first_chunk] if first_chunk is not None else []
+        if first_chunk is not None:
+            yield f"data: {first_chunk}\n\n"
+        async for chunk in chunks:
             full_response.append(chunk)
             yield f"data: {chunk}\n\n"
 
-        memory_queue.put_nowait(request.prompt)
-
-    return StreamingResponse(generate_chunks(), media_type="text/event-stream")
+        if use_cache:
+            await response_cache.put(request.prompt, cache_context, full_response)
+        await memory_queue.put(request.prompt, MessageKind.TEXT)
+
+    return StreamingResponse(
+        generate_chunks(),
+        media_type="text/event-stream",
+        headers={
+            "Server-Timing": timings.server_timing(),
+            "X-Response-Cache": "miss" if use_cache else "off",
+        },
+    )
 
 
 @app.post("/generate/voice")
@@ -240,11 +471,36 @@ async def voice_stream(file: UploadFile = File(...), frontendTools: str = ""):
     output = voice_agent.generate(str(filename), frontendTools)
     logger.info(f"Output from model: {output}")
 
-    memory_queue.put_nowait(str(filename))
+    if not await memory_queue.put(str(filename), MessageKind.VOICE):
+        filename.unlink()
 
     return {"response": output}
 
 
+@app.get("/ready")
+async def ready():
+    # Load balancers only route to an instance whose model is loaded
+    if current_mode == Mode.VOICE:
+        if voice_agent is None:
+            raise HTTPException(
+                status_code=503, detail={"ready": False, "mode": current_mode.value}
+            )
+        return {"ready": True, "mode": current_mode.value}
+
+    residency = await model_warmer.residency()
+    status = {
+        "mode": current_mode.value,
+        **residency,
+        "warmUp": model_warmer.stats(),
+    }
+    if not residency["resident"]:
+        # expiresAt is a datetime, HTTPException details are not encoded
+        return JSONResponse(
+            status_code=503, content=jsonable_encoder({"ready": False, **status})
+        )
+    return {"ready": True, **status}
+
+
 @app.post("/mode/switch")
 async def switch_mode(mode: Mode):
     global current_mode
@@ -263,14 +519,16 @@ async def switch_mode(mode: Mode):
         voice_memory_agent = None
         gc.collect()
 
-        comm_agent = CommunicationAgent()
+        comm_agent = CommunicationAgent(chat_checkpointer)
         memory_agent = MemoryAgent()
+        model_warmer.resume()
         logger.info("Successfully loaded text agents")
     elif mode == Mode.VOICE and current_mode == Mode.TEXT:
         logger.info("Off-loading text agents, loading voice agents")
         comm_agent = None
         memory_agent = None
         gc.collect()
+        await model_warmer.unload()
 
         voice_agent = VoiceCommunicationAgent()
         voice_memory_agent = VoiceMemoryAgent()
@@ -309,12 +567,17 @@ def get_prompt(key: str):
 
 
 @app.put("/prompt")
-def set_prompt(request: SetPromptRequest):
+async def set_prompt(request: SetPromptRequest):
     _check_god_mode()
     if request.key not in VALID_PROMPT_KEYS:
         raise HTTPException(status_code=400, detail=f"Invalid key: '{request.key}'")
 
-    SystemPromptStore().store_prompt(key=request.key, prompt=request.prompt)
+    await asyncio.to_thread(
+        SystemPromptStore().store_prompt, key=request.key, prompt=request.prompt
+    )
+    PromptAssembler().invalidate()
+    if response_cache:
+        await response_cache.invalidate()
 
     return {"status": "ok"}
 
@@ -337,6 +600,36 @@ async def create_memory(request: CreateMemoryRequest):
         )
 
 
+@app.get("/memories/queue-stats")
+async def get_memory_queue_stats():
+    _check_god_mode()
+    return {
+        "queueStats": await memory_batcher.stats() if memory_batcher else None,
+        "prefilterStats": memory_agent.get_prefilter_stats() if memory_agent else None,
+    }
+
+
+@app.get("/llm/scheduler-stats")
+def get_llm_scheduler_stats():
+    _check_god_mode()
+    return LangchainOllamaGemmaClient().scheduler.stats()
+
+
+@app.get("/response-cache/stats")
+def get_response_cache_stats():
+    _check_god_mode()
+    return {
+        "enabled": response_cache is not None,
+        **(response_cache.stats() if response_cache else {}),
+    }
+
+
+@app.post("/memories/compact")
+async def compact_memories():
+    _check_god_mode()
+    return {"status": "ok", **await asyncio.to_thread(MemoryCompactor().compact)}
+
+
 @app.delete("/memories")
 def delete_memories():
     _check_god_mode()
@@ -352,6 +645,9 @@ async def onboard_device(onboarding_request: OnboardingRequest):
 
     global onboarding_task
     user_info_store.onboard_user(onboarding_request)
+    PromptAssembler().invalidate()
+    if response_cache:
+        await response_cache.invalidate()
     onboarding_task = asyncio.create_task(onboarding_tasks(onboarding_request))
     return {"status": OnboardingResponse.OK}
 
@@ -360,6 +656,7 @@ async def onboard_device(onboarding_request: OnboardingRequest):
 def delete_user():
     _check_god_mode()
     UserInfoStore().delete_user()
+    PromptAssembler().invalidate()
     MapStore(create_if_no_exists=True).delete_cache()
     ChecklistStore().delete_cache()
     return {"status": "ok"}
@@ -417,14 +714,178 @@ def get_active_alerts(latitude: float, longitude: float):
     return {"activeAlerts": nws_api.get_active_alerts()}
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+def _tile_headers(tile_hash: str) -> dict:
+    return {
+        "ETag": f'"{tile_hash}"',
+        "Cache-Control": f"public, max-age={MAP_TILE_HTTP_MAX_AGE}",
+    }
+
+
 @app.get("/map/{z}/{x}/{y}.png")
-def get_map_tiles(z: int, x: int, y: int):
+def get_map_tiles(
+    z: int, x: int, y: int, if_none_match: Optional[str] = Header(default=None)
+):
     map_store = MapStore()
-    tile_data = map_store.get_tile(x, y, z)
-    if tile_data is None:
+    # A revalidation is answered from the hash alone, the blob is only read
+    # for a 200
+    if if_none_match is not None:
+        tile_hash = map_store.get_tile_hash(x, y, z)
+        if tile_hash is None:
+            logger.error("Tile not found")
+            raise HTTPException(status_code=404, detail="Tile not found")
+        headers = _tile_headers(tile_hash)
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    tile = map_store.get_tile(x, y, z)
+    if tile is None:
         logger.error("Tile not found")
         raise HTTPException(status_code=404, detail="Tile not found")
-    return Response(tile_data, media_type="image/png")
+
+    tile_hash, tile_data = tile
+    return Response(tile_data, media_type="image/png", headers=_tile_headers(tile_hash))
+
+
+@app.get("/map/cache-stats")
+def get_map_cache_stats():
+    _check_god_mode()
+    try:
+        map_store = MapStore()
+
+        return {"cacheStats": map_store.get_tile_cache_stats()}
+    except ValueError:
+        raise HTTPException(status_code=404, detail="No offline maps found")
+
+
+MIN_MAP_AREA_POINTS = {
+    MapAreaType.CIRCLE: 1,
+    MapAreaType.CORRIDOR: 2,
+    MapAreaType.POLYGON: 3,
+}
+
+
+@app.post("/map/areas")
+async def add_map_area(request: MapAreaRequest):
+    if len(request.points) < MIN_MAP_AREA_POINTS[request.type]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A {request.type.value} needs at least {MIN_MAP_AREA_POINTS[request.type]} points",
+        )
+    if request.type != MapAreaType.POLYGON and request.radiusMiles <= 0:
+        raise HTTPException(status_code=400, detail="radiusMiles must be positive")
+
+    points = [(point.latitude, point.longitude) for point in request.points]
+    # Tiles grow with the square of the extent, one oversized area would
+    # fill the disk and keep the downloader busy for days
+    extent = build_map_area(
+        request.type.value, points, request.radiusMiles
+    ).extent_miles
+    if extent > MAP_AREA_MAX_EXTENT_MILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The area spans {extent:.0f} miles, at most {MAP_AREA_MAX_EXTENT_MILES} are allowed",
+        )
+
+    map_store = MapStore(create_if_no_exists=True)
+    lat, lon = map_store.get_cached_lat_lon()
+    if lat is None or lon is None or (lat == 0.0 and lon == 0.0):
+        raise HTTPException(status_code=404, detail="User not onboarded yet.")
+
+    area_id = await asyncio.to_thread(
+        map_store.add_area,
+        name=request.name,
+        area_type=request.type.value,
+        points=points,
+        radius_miles=request.radiusMiles,
+    )
+    start_map_download(lat, lon)
+    return {"status": "ok", "id": area_id}
+
+
+@app.get("/map/areas")
+def get_map_areas():
+    try:
+        return {"areas": MapStore().get_areas()}
+    except ValueError:
+        return {"areas": []}
+
+
+@app.delete("/map/areas/{area_id}")
+def delete_map_area(area_id: int):
+    try:
+        MapStore().delete_area(area_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="No offline maps found")
+    return {"status": "ok"}
+
+
+@app.post("/map/import")
+async def import_map_tiles(file: UploadFile = File(...)):
+    _check_god_mode()
+
+    # Spool the upload to disk, an MBTiles package can be gigabytes
+    with tempfile.NamedTemporaryFile(suffix=".mbtiles", delete=False) as tmp:
+        while chunk := await file.read(1024 * 1024):
+            tmp.write(chunk)
+
+    # A bad upload is turned away before the running download is touched
+    try:
+        await asyncio.to_thread(validate_mbtiles, tmp.name)
+    except ValueError as e:
+        os.remove(tmp.name)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # A running download would overwrite the frontier the import resets
+    if map_download_task is not None and not map_download_task.done():
+        map_download_task.cancel()
+        try:
+            await map_download_task
+        except asyncio.CancelledError:
+            pass
+
+    map_store = MapStore(create_if_no_exists=True)
+    try:
+        imported = await asyncio.to_thread(import_mbtiles, map_store, tmp.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(tmp.name)
+        # Restarted even when the import failed, only the tiles the package
+        # did not cover are left to download
+        lat, lon = map_store.get_cached_lat_lon()
+        if lat is not None and lon is not None and (lat != 0.0 or lon != 0.0):
+            if not map_store.is_download_complete():
+                start_map_download(lat, lon)
+
+    return {"status": "ok", "importedTiles": imported}
+
+
+@app.get("/map/export")
+async def export_map_tiles():
+    _check_god_mode()
+    try:
+        map_store = MapStore()
+    except ValueError:
+        raise HTTPException(status_code=404, detail="No offline maps found")
+
+    path = os.path.join(tempfile.mkdtemp(), "offline_map.mbtiles")
+    await asyncio.to_thread(export_mbtiles, map_store, path)
+    return FileResponse(
+        path,
+        media_type="application/vnd.sqlite3",
+        filename="offline_map.mbtiles",
+        background=BackgroundTask(shutil.rmtree, os.path.dirname(path)),
+    )
 
 
 @app.get("/map/download-status")
@@ -432,9 +893,12 @@ def get_map_download_status():
     try:
         map_store = MapStore()
 
-        return {"downloadStatus": map_store.get_download_status()}
+        return {
+            "downloadStatus": map_store.get_download_status(),
+            "coverageRadius": map_store.get_coverage_radius(),
+        }
     except ValueError:
-        return {"downloadStatus": 0}
+        return {"downloadStatus": 0, "coverageRadius": 0}
 
 
 @app.get("/current-checklist")
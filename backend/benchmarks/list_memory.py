@@ -0,0 +1,79 @@
+"""Benchmark MemoryStore.list_memory against the per-key JSON.GET read path.
+
+Run from the backend directory against a Redis Stack instance:
+
+    uv run python -m benchmarks.list_memory --redis redis://localhost:6379/15
+
+The benchmark flushes the given database, so never point it at the one the
+app uses.
+"""
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+
+
+def seed_memories(client, store, count: int):
+    store.delete_all_memory()
+    pipeline = client.pipeline(transaction=False)
+    now = time.time()
+    for i in range(count):
+        key = f"store:{uuid.uuid4()}"
+        # Same document shape as langgraph's RedisStore
+        pipeline.json().set(
+            key,
+            "$",
+            {
+                "prefix": "memories.1",
+                "key": key,
+                "value": {f"fact_{i}": f"memory number {i}"},
+                "created_at": now + i,
+                "updated_at": now + i,
+            },
+        )
+        if i % 1000 == 999:
+            pipeline.execute()
+    pipeline.execute()
+
+
+def legacy_list_memory(client):
+    return [client.json().get(key, "$.value") for key in client.scan_iter("store:*")]
+
+
+def time_it(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis", default="redis://localhost:6379/15")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # MemoryStore reads REDIS_HOST at import time
+    os.environ["REDIS_HOST"] = args.redis
+    import redis
+    from service.utils.memory_store import MemoryStore
+
+    client = redis.Redis.from_url(args.redis)
+    store = MemoryStore()
+
+    print(f"{'memories':>10} {'per-key ms':>12} {'bulk ms':>10} {'snapshot ms':>12}")
+    for size in args.sizes:
+        seed_memories(client, store, size)
+        assert len(store.list_memory(refresh=True)) == size
+
+        legacy = time_it(lambda: legacy_list_memory(client), args.repeat)
+        bulk = time_it(lambda: store.list_memory(refresh=True), args.repeat)
+        snapshot = time_it(store.list_memory, args.repeat)
+        print(f"{size:>10} {legacy:>12.1f} {bulk:>10.1f} {snapshot:>12.3f}")
+
+    client.flushdb()
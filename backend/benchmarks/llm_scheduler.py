@@ -0,0 +1,137 @@
+"""Measure how long a chat turn waits behind background model calls.
+
+Starts a fake Ollama server that answers /api/chat after a fixed delay
+and, like Ollama, runs at most --parallel requests at once. A burst of
+checklist and memory calls is fired first, then a few chat calls, once
+through the LLM scheduler and once straight at the model. Run it from
+the backend directory:
+
+    uv run python -m benchmarks.llm_scheduler
+
+No real Ollama, Redis or Mongo is needed.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import threading
+import asyncio
+import json
+import time
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    slots: threading.Semaphore
+    delay: float
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        # Ollama queues whatever exceeds OLLAMA_NUM_PARALLEL
+        with self.slots:
+            time.sleep(self.delay)
+
+        chunks = [
+            {"message": {"role": "assistant", "content": "ok"}, "done": False},
+            {
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+            },
+        ]
+        body = b"".join(
+            json.dumps(
+                {"model": request.get("model"), "created_at": "", **chunk}
+            ).encode()
+            + b"\n"
+            for chunk in chunks
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_ollama(parallel: int, delay: float) -> ThreadingHTTPServer:
+    FakeOllamaHandler.slots = threading.Semaphore(parallel)
+    FakeOllamaHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def timed_call(model, message: str) -> float:
+    started_at = time.perf_counter()
+    await model.ainvoke([{"role": "user", "content": message}])
+    return time.perf_counter() - started_at
+
+
+async def run_burst(models: dict, args) -> list[float]:
+    background = [
+        asyncio.create_task(timed_call(models["checklist"], "checklist"))
+        for _ in range(args.checklist_calls)
+    ] + [
+        asyncio.create_task(timed_call(models["memory"], "memory"))
+        for _ in range(args.memory_calls)
+    ]
+    # Let the burst reach the server before the user speaks
+    await asyncio.sleep(0.05)
+
+    chat_latencies = []
+    for _ in range(args.chat_calls):
+        chat_latencies.append(await timed_call(models["interactive"], "sos"))
+    await asyncio.gather(*background)
+    return chat_latencies
+
+
+async def main(args):
+    from langchain_ollama import ChatOllama
+    from service.model.llm_scheduler import (
+        LLMScheduler,
+        LLMPriority,
+        ScheduledChatModel,
+    )
+
+    server = start_fake_ollama(args.parallel, args.delay)
+    model = ChatOllama(
+        model="fake", base_url=f"http://127.0.0.1:{server.server_address[1]}"
+    )
+
+    unscheduled = await run_burst(
+        {"checklist": model, "memory": model, "interactive": model}, args
+    )
+
+    scheduler = LLMScheduler(
+        max_concurrency=args.parallel,
+        interactive_reserved_slots=args.reserved_slots,
+    )
+    scheduled = await run_burst(
+        {
+            priority.name.lower(): ScheduledChatModel(model, scheduler, priority)
+            for priority in LLMPriority
+        },
+        args,
+    )
+    server.shutdown()
+
+    print(f"{'':<12}{'mean chat':>12}{'worst chat':>12}")
+    for name, latencies in (("direct", unscheduled), ("scheduled", scheduled)):
+        print(
+            f"{name:<12}{sum(latencies) / len(latencies):>11.2f}s{max(latencies):>11.2f}s"
+        )
+    print(json.dumps(scheduler.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--reserved-slots", type=int, default=1)
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds per call")
+    parser.add_argument("--checklist-calls", type=int, default=6)
+    parser.add_argument("--memory-calls", type=int, default=6)
+    parser.add_argument("--chat-calls", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""Measure tile read throughput through the SQLite connection pool.
+
+Seeds a throwaway map database with random tiles, then reads them from
+several threads, once opening a connection per read like MapStore used
+to, once through the pooled per-thread readers and once through
+MapStore.get_tile with its in-memory tile cache. Run it from the backend
+directory:
+
+    uv run python -m benchmarks.map_tile_reads
+
+With --close-every the pool is closed that often while the readers run,
+which must never fail a read that is already in flight.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+SELECT_TILE = "SELECT t.hash, b.data FROM tiles t JOIN blobs b ON b.hash = t.hash WHERE t.z=? AND t.x=? AND t.y=?"
+
+
+def seed(map_store, tiles: int, tile_size: int) -> list[tuple[int, int, int]]:
+    side = int(tiles**0.5) + 1
+    keys = [(14, x, y) for x in range(side) for y in range(side)][:tiles]
+    map_store.store_tiles([(z, x, y, os.urandom(tile_size)) for z, x, y in keys])
+    return keys
+
+
+def run_readers(read, keys, threads: int, reads: int, close=None, close_every=0):
+    errors = []
+    per_thread = reads // threads
+
+    def reader():
+        rng = random.Random()
+        for _ in range(per_thread):
+            try:
+                if read(*rng.choice(keys)) is None:
+                    errors.append("missing tile")
+            except sqlite3.Error as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=reader) for _ in range(threads)]
+    started_at = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    while close is not None and any(worker.is_alive() for worker in workers):
+        time.sleep(close_every)
+        close()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started_at
+    return per_thread * threads / elapsed, errors
+
+
+def main(args):
+    # MapStore and the pool resolve the database name against the cwd
+    os.chdir(tempfile.mkdtemp(prefix="map-bench-"))
+    from service.utils.constants import MAP_DB_NAME
+    from service.utils.map_store import MapStore, _connection_pool
+
+    keys = seed(MapStore(create_if_no_exists=True), args.tiles, args.tile_size)
+
+    def per_call(z, x, y):
+        conn = sqlite3.connect(MAP_DB_NAME)
+        try:
+            row = conn.execute(SELECT_TILE, (z, x, y)).fetchone()
+        finally:
+            conn.close()
+        return row[1] if row else None
+
+    def pooled(z, x, y):
+        row = _connection_pool.reader().execute(SELECT_TILE, (z, x, y)).fetchone()
+        return row[1] if row else None
+
+    def cached(z, x, y):
+        return MapStore().get_tile(x, y, z)[1]
+
+    close = _connection_pool.close if args.close_every else None
+    print(f"{'':<12}{'tiles/s':>12}{'errors':>8}")
+    for name, read in (("per call", per_call), ("pooled", pooled), ("cached", cached)):
+        rate, errors = run_readers(
+            read,
+            keys,
+            args.threads,
+            args.reads,
+            close=close,
+            close_every=args.close_every,
+        )
+        print(f"{name:<12}{rate:>12,.0f}{len(errors):>8}")
+        if errors:
+            print(f"  first error: {errors[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tiles", type=int, default=1600)
+    parser.add_argument("--tile-size", type=int, default=15 * 1024, help="Bytes")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument(
+        "--close-every", type=float, default=0, help="Seconds, 0 never closes"
+    )
+    main(parser.parse_args())
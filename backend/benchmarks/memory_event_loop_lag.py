@@ -0,0 +1,72 @@
+"""Measure event loop lag while memory extractions run.
+
+A memory extraction must never stall the event loop that serves chat
+streams and map tiles. This runs real extractions against the configured
+Ollama and Redis while a ticker coroutine records how late it wakes up.
+Run it from the backend directory:
+
+    uv run python -m benchmarks.memory_event_loop_lag
+
+It exits with status 1 if the worst lag exceeds --max-lag-ms, so it can
+guard against synchronous calls creeping back into the memory pipeline.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+
+MESSAGES = [
+    "My name is Dana and I live at 12 Oak Street with my two kids.",
+    "My son has asthma and we are running low on his inhaler.",
+    "The water is rising in our basement and the power is out.",
+]
+
+
+async def measure_lag(stop: asyncio.Event, interval: float) -> list[float]:
+    lags = []
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(time.perf_counter() - expected, 0.0))
+    return lags
+
+
+async def main(args) -> int:
+    from service.agents import MemoryAgent
+
+    agent = MemoryAgent()
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, args.interval_ms / 1000))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *[agent.store_memory(message) for message in MESSAGES * args.rounds]
+    )
+    elapsed = time.perf_counter() - started_at
+
+    stop.set()
+    lags_ms = [lag * 1000 for lag in await ticker]
+    worst = max(lags_ms, default=0.0)
+
+    print(f"extractions: {len(MESSAGES) * args.rounds} in {elapsed:.1f}s")
+    print(
+        f"event loop lag: median {statistics.median(lags_ms or [0]):.1f}ms, "
+        f"max {worst:.1f}ms over {len(lags_ms)} ticks"
+    )
+    if worst > args.max_lag_ms:
+        print(f"FAIL: event loop was blocked for more than {args.max_lag_ms}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--interval-ms", type=float, default=10)
+    parser.add_argument("--max-lag-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
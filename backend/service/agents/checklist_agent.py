@@ -18,6 +18,7 @@ from service.data_models.onboarding import (
     Phase,
 )
 from service.model.ollama_client import LangchainOllamaGemmaClient
+from service.model.llm_scheduler import LLMPriority
 from service.utils.checklist_store import ChecklistStore
 from service.utils.prompt_store import SystemPromptStore
 from service.utils.constants import (
@@ -49,7 +50,7 @@ class ChecklistAgentState(TypedDict):
 class ChecklistBuilderAgent:
     def __init__(self):
         self.max_iterations = 3
-        self.llm = LangchainOllamaGemmaClient().model
+        self.llm = LangchainOllamaGemmaClient().scheduled(LLMPriority.CHECKLIST)
         self.checklist_store = ChecklistStore()
         self.graph = self.__create_graph()
 
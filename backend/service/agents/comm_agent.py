@@ -1,68 +1,257 @@
 from langgraph.graph import StateGraph, MessagesState, START, END
+from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+from langchain_core.messages import AnyMessage, AIMessage, HumanMessage, RemoveMessage
 from langchain_core.runnables import RunnableConfig
 from langfuse.langchain import CallbackHandler
+from typing import Optional
+from redis.asyncio import Redis
+import asyncio
+import logging
+import time
 import sys
-import json
 
-from service.utils.constants import COMM_AGENT_SYS_PROMPT_KEY
-from service.utils.prompt_store import SystemPromptStore
+from service.utils.constants import (
+    COMM_AGENT_SYS_PROMPT_KEY,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    CHAT_HISTORY_KEEP_MESSAGES,
+    CHAT_SUMMARY_TOKEN_BUDGET,
+    CHAT_HISTORY_TTL,
+)
+from service.utils.prompt_assembler import PromptAssembler, truncate_to_budget
 from service.utils.user_info_store import UserInfoStore
-from service.utils.memory_store import MemoryStore
-from service.model import LangchainOllamaGemmaClient
+from service.utils.memory_retriever import build_memory_context
+from service.utils.parsing_utils import estimate_tokens
+from service.utils.turn_timings import TurnTimings
+from service.prompts.communication_agent_prompts import (
+    COMMUNICATION_AGENT_SUMMARY_PROMPT,
+)
+from service.model import LangchainOllamaGemmaClient, LLMPriority
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChatState(MessagesState):
+    # Rolling summary of the messages dropped from the thread
+    summary: str
+
+
+def window_messages(messages: list[AnyMessage], token_budget: int) -> list:
+    # The newest messages that fit the budget, the latest one always does
+    window = []
+    used_tokens = 0
+    for message in reversed(messages):
+        tokens = estimate_tokens(str(message.content))
+        if window and used_tokens + tokens > token_budget:
+            break
+        window.append(message)
+        used_tokens += tokens
+    return window[::-1]
+
+
+def create_chat_checkpointer(client: Redis) -> AsyncRedisSaver:
+    # The caller owns the client, one connection pool serves every agent
+    # created across mode switches and is closed at shutdown
+    return AsyncRedisSaver(redis_client=client, ttl={"default_ttl": CHAT_HISTORY_TTL})
 
 
 class CommunicationAgent:
-    def __init__(self):
+    def __init__(self, checkpointer: AsyncRedisSaver):
         model_obj = LangchainOllamaGemmaClient()
-        self.model = model_obj.model
+        self.model = model_obj.scheduled(LLMPriority.INTERACTIVE)
+        self.__summary_model = model_obj.scheduled(LLMPriority.MEMORY)
+
+        # Nothing connects until the first turn runs asetup()
+        self.__checkpointer = checkpointer
+        self.__checkpointer_ready = False
+        self.__checkpointer_lock = asyncio.Lock()
+
+        builder = StateGraph(ChatState)
+        builder.add_node("call_model", self.__call_model)
+
+        builder.add_edge(START, "call_model")
+        builder.add_edge("call_model", END)
+
+        self.__graph = builder.compile(checkpointer=self.__checkpointer)
+        self.__langfuse_handler = CallbackHandler()
+
+        self.__summarizing: set[str] = set()
+        self.__background_tasks: set[asyncio.Task] = set()
 
     async def __call_model(
         self,
-        state: MessagesState,
+        state: ChatState,
         config: RunnableConfig,
     ):
-        memories = MemoryStore().list_memory()
-        info = []
-        for memory in memories:
-            for key, val in memory[0].items():
-                info.append(f"{key}: {val}")
-        info = "\n".join(info)
-
-        user_details = UserInfoStore().get_user_document()
-        del user_details["_id"]
-        memory_attachment = (
-            """
-            You are given a compressed information about previous conversation history in chronological order:\n\n{info}.
-            And here are the details about the user stored when they onboarded: {stored_user_info}
-            """.strip()
-        ).format(info=info, stored_user_info=json.dumps(user_details))
-        system_msg = f"{SystemPromptStore().get_prompt(key=COMM_AGENT_SYS_PROMPT_KEY)}\n{memory_attachment}"
+        # The thread keeps everything until it is summarized, the model only
+        # ever sees the window, so the prompt size stays bounded
+        turn = config["configurable"]["turn"]
+        started_at = time.perf_counter()
+        history = window_messages(state["messages"], CHAT_HISTORY_TOKEN_BUDGET)
+        system_msg = PromptAssembler().assemble(
+            COMM_AGENT_SYS_PROMPT_KEY,
+            turn["memory_info"],
+            tools=turn["frontend_tools"],
+            summary=state.get("summary", ""),
+        )
+        turn["timings"].prompt_build = time.perf_counter() - started_at
         response = await self.model.ainvoke(
-            [{"role": "system", "content": system_msg}] + state["messages"], config
+            [{"role": "system", "content": system_msg}] + history, config
         )
         return {"messages": response}
 
-    async def generate(self, prompt: str):
-        builder = StateGraph(MessagesState)
-        builder.add_node("call_model", self.__call_model)
+    async def __ensure_checkpointer(self):
+        if self.__checkpointer_ready:
+            return
+        async with self.__checkpointer_lock:
+            if not self.__checkpointer_ready:
+                await self.__checkpointer.asetup()
+                self.__checkpointer_ready = True
+                logger.info("Redis chat checkpointer indices are ready")
 
-        builder.add_edge(START, "call_model")
-        builder.add_edge("call_model", END)
+    async def __memory_context(self, query: str, memory_info: Optional[str]) -> str:
+        if memory_info is not None:
+            return memory_info
+        return await asyncio.to_thread(build_memory_context, query=query)
 
-        langfuse_handler = CallbackHandler()
+    async def __gather_context(
+        self, memory_query: str, timings: TurnTimings, memory_info: Optional[str]
+    ) -> tuple[str, str]:
+        # Redis and Mongo are blocking clients, fetch everything off the
+        # event loop and at the same time
+        started_at = time.perf_counter()
+        info, _, user_id, _ = await asyncio.gather(
+            self.__memory_context(memory_query, memory_info),
+            asyncio.to_thread(
+                PromptAssembler().get_static_prefix, COMM_AGENT_SYS_PROMPT_KEY
+            ),
+            asyncio.to_thread(UserInfoStore().get_user_id),
+            self.__ensure_checkpointer(),
+        )
+        timings.context_fetch = time.perf_counter() - started_at
+        return info, self.__thread_id(user_id)
+
+    def __thread_id(self, user_id: Optional[str]) -> str:
+        # A new onboarding starts a new conversation
+        return f"chat:{user_id or 'anonymous'}"
 
-        graph = builder.compile()
+    async def __summarize_history(self, thread_id: str):
+        config = {"configurable": {"thread_id": thread_id}}
+        state = await self.__graph.aget_state(config)
+        messages = state.values.get("messages", [])
+        tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        if (
+            tokens <= CHAT_HISTORY_TOKEN_BUDGET
+            or len(messages) <= CHAT_HISTORY_KEEP_MESSAGES
+        ):
+            return
+
+        dropped = messages[:-CHAT_HISTORY_KEEP_MESSAGES]
+        summary = state.values.get("summary", "")
+        transcript = "\n".join(
+            f"{message.type}: {message.content}" for message in dropped
+        )
+        response = await self.__summary_model.ainvoke(
+            [
+                {
+                    "role": "system",
+                    "content": COMMUNICATION_AGENT_SUMMARY_PROMPT.format(
+                        summary=summary or "(empty)"
+                    ),
+                },
+                {"role": "user", "content": transcript},
+            ],
+            {"callbacks": [self.__langfuse_handler]},
+        )
+        summary = truncate_to_budget(
+            str(response.content).strip(), CHAT_SUMMARY_TOKEN_BUDGET, "chat summary"
+        )
+
+        await self.__graph.aupdate_state(
+            config,
+            {
+                "messages": [RemoveMessage(id=message.id) for message in dropped],
+                "summary": summary,
+            },
+            as_node="call_model",
+        )
+        logger.info(
+            f"Summarized {len(dropped)} messages of {thread_id}, {tokens} tokens of history"
+        )
+
+    async def __summarize_in_background(self, thread_id: str):
+        # One summary per thread at a time, a second one would overwrite it
+        if thread_id in self.__summarizing:
+            return
+        self.__summarizing.add(thread_id)
+        try:
+            await self.__summarize_history(thread_id)
+        except Exception as e:
+            logger.error(f"Failed to summarize chat history: {e}")
+        finally:
+            self.__summarizing.discard(thread_id)
+
+    async def generate(
+        self,
+        prompt: str,
+        frontend_tools: str = "",
+        timings: Optional[TurnTimings] = None,
+        memory_info: Optional[str] = None,
+    ):
+        # memory_info is passed in when the caller already retrieved it
+        timings = timings or TurnTimings()
+        info, thread_id = await self.__gather_context(prompt, timings, memory_info)
 
         config = {
-            "configurable": {"thread_id": "1", "user_id": "1"},
-            "callbacks": [langfuse_handler],
+            "configurable": {
+                "thread_id": thread_id,
+                # Kept in a dict, plain string values of configurable are
+                # copied into every checkpoint's metadata
+                "turn": {
+                    "memory_info": info,
+                    "frontend_tools": frontend_tools,
+                    "timings": timings,
+                },
+            },
+            "callbacks": [self.__langfuse_handler],
         }
 
-        async for msg, _ in graph.astream(
+        async for msg, _ in self.__graph.astream(
             {"messages": [{"role": "user", "content": prompt}]},
             config,
             stream_mode="messages",
         ):
             if msg.content:
+                timings.mark_first_token()
                 sys.stdout.flush()
                 yield msg.content
+
+        timings.finish()
+        logger.info(f"Text generation timings: {timings}")
+
+        self.__schedule_summary(thread_id)
+
+    def __schedule_summary(self, thread_id: str):
+        # Folding old messages into the summary is a background model call,
+        # the reply is already out
+        task = asyncio.create_task(self.__summarize_in_background(thread_id))
+        self.__background_tasks.add(task)
+        task.add_done_callback(self.__background_tasks.discard)
+
+    async def record_turn(self, prompt: str, response: str):
+        # A replayed answer never runs the graph, the thread still gets the
+        # turn so the conversation stays continuous
+        try:
+            user_id, _ = await asyncio.gather(
+                asyncio.to_thread(UserInfoStore().get_user_id),
+                self.__ensure_checkpointer(),
+            )
+            thread_id = self.__thread_id(user_id)
+            await self.__graph.aupdate_state(
+                {"configurable": {"thread_id": thread_id}},
+                {"messages": [HumanMessage(prompt), AIMessage(response)]},
+                as_node="call_model",
+            )
+            self.__schedule_summary(thread_id)
+        except Exception as e:
+            logger.error(f"Failed to record the chat turn: {e}")
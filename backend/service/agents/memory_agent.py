@@ -1,16 +1,24 @@
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.store.redis import RedisStore
 from langgraph.store.base import BaseStore
+from langgraph.graph.state import CompiledStateGraph
 from langchain_core.runnables import RunnableConfig
 from langfuse.langchain import CallbackHandler
-import uuid
+from typing import Optional
+import threading
 import logging
+import asyncio
+import uuid
+import time
 
-from service.utils.environment import REDIS_HOST
 from service.utils.constants import MEMORY_AGENT_SYS_PROMPT_KEY
 from service.utils.prompt_store import SystemPromptStore
-from service.utils.parsing_utils import extract_memory_json
-from service.model import LangchainOllamaGemmaClient
+from service.utils.memory_store import MemoryStore
+from service.utils.redis_store import SharedRedisStore
+from service.utils.memory_prefilter import MemoryPrefilter, PrefilterDecision
+from service.utils.environment import MEMORY_PREFILTER_ENABLED
+from service.utils.parsing_utils import extract_memory_json, split_batch_memories
+from service.prompts.memory_agent_prompts import MEMORY_AGENT_BATCH_PROMPT
+from service.model import LangchainOllamaGemmaClient, LLMPriority
 
 
 logger = logging.getLogger(__name__)
@@ -19,62 +27,131 @@ logger = logging.getLogger(__name__)
 class MemoryAgent:
     def __init__(self):
         model_obj = LangchainOllamaGemmaClient()
-        self.model = model_obj.model
+        self.model = model_obj.scheduled(LLMPriority.MEMORY)
+
+        self.__graph: Optional[CompiledStateGraph] = None
+        self.__graph_lock = threading.Lock()
+        self.__prefilter = MemoryPrefilter()
 
-    def __store_memory(
+    async def __store_memory(
         self, state: MessagesState, config: RunnableConfig, *, store: BaseStore
     ):
-        response = self.model.invoke(
-            [
-                {
-                    "role": "system",
-                    "content": SystemPromptStore().get_prompt(
-                        key=MEMORY_AGENT_SYS_PROMPT_KEY
-                    ),
-                },
-            ]
-            + state["messages"]
+        started_at = time.perf_counter()
+        system_prompt = SystemPromptStore().get_prompt(key=MEMORY_AGENT_SYS_PROMPT_KEY)
+        if config["configurable"].get("batch_size", 1) > 1:
+            system_prompt = f"{system_prompt}\n\n{MEMORY_AGENT_BATCH_PROMPT}"
+
+        response = await self.model.ainvoke(
+            [{"role": "system", "content": system_prompt}] + state["messages"],
+            config,
+        )
+        logger.info(
+            f"Memory extraction model call: {time.perf_counter() - started_at:.3f}s"
         )
         return {"messages": response}
 
-    def __get_memory_to_store(
+    async def __save_memory(self, store: BaseStore, user_id: str, memory: dict):
+        namespace = ("memories", user_id)
+        await store.aput(namespace, str(uuid.uuid4()), memory)
+        await asyncio.to_thread(MemoryStore().record_memory, memory)
+        logger.info(f"Successfully added new memory: {memory}")
+
+    async def __get_memory_to_store(
         self, state: MessagesState, config: RunnableConfig, *, store: BaseStore
     ):
+        started_at = time.perf_counter()
         try:
             memory_content = state["messages"][-1].content
-            store_memory_msg = extract_memory_json(memory_content)
-
-            if store_memory_msg:
-                user_id = config["configurable"]["user_id"]
-                namespace = ("memories", user_id)
-                store.put(namespace, str(uuid.uuid4()), store_memory_msg)
-                logger.info(f"Successfully added new memory: {store_memory_msg}")
+            extracted = extract_memory_json(memory_content)
+            batch_size = config["configurable"].get("batch_size", 1)
+            if batch_size > 1:
+                memories = split_batch_memories(extracted, batch_size)
             else:
-                logger.info("No memory to store (empty JSON)")
+                memories = [extracted]
+
+            user_id = config["configurable"]["user_id"]
+            for store_memory_msg in memories:
+                if store_memory_msg:
+                    await self.__save_memory(store, user_id, store_memory_msg)
+                else:
+                    logger.info("No memory to store (empty JSON)")
         except Exception as e:
             logger.error(f"Failed to store memory: {e}")
+        logger.info(
+            f"Memory extraction store write: {time.perf_counter() - started_at:.3f}s"
+        )
 
-    async def store_memory(self, user_message: str):
-        logger.info(f"Starting to add memory for user message: '{user_message}'")
-        with RedisStore.from_conn_string(REDIS_HOST) as store:
-            store.setup()
+    def __get_graph(self) -> CompiledStateGraph:
+        # Compiled graphs keep no per-run state, one is shared by every
+        # concurrent extraction
+        if self.__graph is None:
+            with self.__graph_lock:
+                if self.__graph is None:
+                    builder = StateGraph(MessagesState)
+                    builder.add_node("store_memory", self.__store_memory)
+                    builder.add_node("get_memory_to_store", self.__get_memory_to_store)
 
-            builder = StateGraph(MessagesState)
-            builder.add_node("store_memory", self.__store_memory)
-            builder.add_node("get_memory_to_store", self.__get_memory_to_store)
+                    builder.add_edge(START, "store_memory")
+                    builder.add_edge("store_memory", "get_memory_to_store")
+                    builder.add_edge("get_memory_to_store", END)
 
-            builder.add_edge(START, "store_memory")
-            builder.add_edge("store_memory", "get_memory_to_store")
-            builder.add_edge("get_memory_to_store", END)
+                    self.__graph = builder.compile(store=SharedRedisStore().get_store())
+        return self.__graph
 
-            langfuse_handler = CallbackHandler()
+    async def __prefilter_messages(self, user_messages: list[str]) -> list[str]:
+        # Cheap rules first, only messages with candidate facts reach the LLM
+        to_extract = []
+        for user_message in user_messages:
+            decision, facts = self.__prefilter.classify(user_message)
+            if decision == PrefilterDecision.EXTRACT:
+                to_extract.append(user_message)
+            elif decision == PrefilterDecision.STORE:
+                await self.__save_memory(SharedRedisStore().get_store(), "1", facts)
 
-            graph = builder.compile(store=store)
+        logger.info(
+            f"Memory prefilter sent {len(to_extract)}/{len(user_messages)} messages to the LLM, stats: {self.__prefilter.stats()}"
+        )
+        return to_extract
+
+    def get_prefilter_stats(self) -> dict:
+        return self.__prefilter.stats()
+
+    async def store_memory(self, user_message: str):
+        await self.store_memories([user_message])
+
+    async def store_memories(self, user_messages: list[str]):
+        # Several messages share one prompt, the model answers per message
+        logger.info(f"Starting to add memory for user messages: {user_messages}")
+        started_at = time.perf_counter()
+        # The first call creates the Redis indices, keep it off the event loop
+        graph = await asyncio.to_thread(self.__get_graph)
+        setup_time = time.perf_counter() - started_at
 
-            config = {
-                "configurable": {"thread_id": "1", "user_id": "1"},
-                "callbacks": [langfuse_handler],
-            }
-            graph.invoke(
-                {"messages": [{"role": "user", "content": user_message}]}, config
+        if MEMORY_PREFILTER_ENABLED:
+            user_messages = await self.__prefilter_messages(user_messages)
+            if not user_messages:
+                return
+
+        if len(user_messages) == 1:
+            content = user_messages[0]
+        else:
+            content = "\n".join(
+                f"[{i}] {message}" for i, message in enumerate(user_messages, start=1)
             )
+
+        langfuse_handler = CallbackHandler()
+
+        config = {
+            "configurable": {
+                "thread_id": "1",
+                "user_id": "1",
+                "batch_size": len(user_messages),
+            },
+            "callbacks": [langfuse_handler],
+        }
+        await graph.ainvoke(
+            {"messages": [{"role": "user", "content": content}]}, config
+        )
+        logger.info(
+            f"Memory extraction of {len(user_messages)} messages took {time.perf_counter() - started_at:.3f}s, graph and store setup {setup_time:.3f}s"
+        )
@@ -1,15 +1,20 @@
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.store.redis import RedisStore
 from langgraph.store.base import BaseStore
+from langgraph.graph.state import CompiledStateGraph
 from langchain_core.runnables import RunnableConfig
 from langfuse.langchain import CallbackHandler
-import uuid
+from typing import Optional
+import threading
 import logging
+import asyncio
+import uuid
+import time
 from pathlib import Path
 
-from service.utils.environment import REDIS_HOST
 from service.utils.constants import MEMORY_AGENT_SYS_PROMPT_KEY
 from service.utils.prompt_store import SystemPromptStore
+from service.utils.memory_store import MemoryStore
+from service.utils.redis_store import SharedRedisStore
 from service.utils.parsing_utils import extract_memory_json
 from service.agents.voice_agent_base import VoiceAgentBase
 
@@ -18,20 +23,36 @@ logger = logging.getLogger(__name__)
 
 
 class VoiceMemoryAgent(VoiceAgentBase):
-    def __store_memory(
-        self, state: MessagesState, config: RunnableConfig, *, store: BaseStore
-    ):
-        audio_path = state["messages"][-1].content
+    def __init__(self):
+        super().__init__()
+
+        self.__graph: Optional[CompiledStateGraph] = None
+        self.__graph_lock = threading.Lock()
+
+    def __generate(self, audio_path: str) -> str:
         messages = self.construct_model_messages(
             audio_path=audio_path,
             system_msg=SystemPromptStore().get_prompt(key=MEMORY_AGENT_SYS_PROMPT_KEY),
         )
+        return self.model.invoke(messages)
 
-        return {"messages": self.model.invoke(messages)}
+    async def __store_memory(
+        self, state: MessagesState, config: RunnableConfig, *, store: BaseStore
+    ):
+        started_at = time.perf_counter()
+        audio_path = state["messages"][-1].content
+        # Audio decoding and HF generation are synchronous, run them off the
+        # event loop so chat streams and map tiles keep flowing
+        response = await asyncio.to_thread(self.__generate, audio_path)
+        logger.info(
+            f"Memory extraction model call: {time.perf_counter() - started_at:.3f}s"
+        )
+        return {"messages": response}
 
-    def __get_memory_to_store(
+    async def __get_memory_to_store(
         self, state: MessagesState, config: RunnableConfig, *, store: BaseStore
     ):
+        started_at = time.perf_counter()
         try:
             memory_content = state["messages"][-1].content
             store_memory_msg = extract_memory_json(memory_content)
@@ -39,37 +60,53 @@ class VoiceMemoryAgent(VoiceAgentBase):
             if store_memory_msg:
                 user_id = config["configurable"]["user_id"]
                 namespace = ("memories", user_id)
-                store.put(namespace, str(uuid.uuid4()), store_memory_msg)
+                await store.aput(namespace, str(uuid.uuid4()), store_memory_msg)
+                await asyncio.to_thread(MemoryStore().record_memory, store_memory_msg)
                 logger.info(f"Successfully added new memory: {store_memory_msg}")
             else:
                 logger.info("No memory to store (empty JSON)")
         except Exception as e:
             logger.error(f"Failed to store memory: {e}")
+        logger.info(
+            f"Memory extraction store write: {time.perf_counter() - started_at:.3f}s"
+        )
 
-    async def store_memory(self, user_voice_file: str):
-        logger.info(f"Starting to add memory for user message: '{user_voice_file}'")
-        with RedisStore.from_conn_string(REDIS_HOST) as store:
-            store.setup()
+    def __get_graph(self) -> CompiledStateGraph:
+        # Compiled graphs keep no per-run state, one is shared by every
+        # concurrent extraction
+        if self.__graph is None:
+            with self.__graph_lock:
+                if self.__graph is None:
+                    builder = StateGraph(MessagesState)
+                    builder.add_node("store_memory", self.__store_memory)
+                    builder.add_node("get_memory_to_store", self.__get_memory_to_store)
 
-            builder = StateGraph(MessagesState)
-            builder.add_node("store_memory", self.__store_memory)
-            builder.add_node("get_memory_to_store", self.__get_memory_to_store)
+                    builder.add_edge(START, "store_memory")
+                    builder.add_edge("store_memory", "get_memory_to_store")
+                    builder.add_edge("get_memory_to_store", END)
 
-            builder.add_edge(START, "store_memory")
-            builder.add_edge("store_memory", "get_memory_to_store")
-            builder.add_edge("get_memory_to_store", END)
+                    self.__graph = builder.compile(store=SharedRedisStore().get_store())
+        return self.__graph
 
-            langfuse_handler = CallbackHandler()
+    async def store_memory(self, user_voice_file: str):
+        logger.info(f"Starting to add memory for user message: '{user_voice_file}'")
+        started_at = time.perf_counter()
+        # The first call creates the Redis indices, keep it off the event loop
+        graph = await asyncio.to_thread(self.__get_graph)
+        setup_time = time.perf_counter() - started_at
 
-            graph = builder.compile(store=store)
+        langfuse_handler = CallbackHandler()
 
-            config = {
-                "configurable": {"thread_id": "1", "user_id": "1"},
-                "callbacks": [langfuse_handler],
-            }
-            graph.invoke(
-                {"messages": [{"role": "user", "content": user_voice_file}]}, config
-            )
+        config = {
+            "configurable": {"thread_id": "1", "user_id": "1"},
+            "callbacks": [langfuse_handler],
+        }
+        await graph.ainvoke(
+            {"messages": [{"role": "user", "content": user_voice_file}]}, config
+        )
+        logger.info(
+            f"Memory extraction took {time.perf_counter() - started_at:.3f}s, graph and store setup {setup_time:.3f}s"
+        )
 
         file = Path(user_voice_file)
         file.unlink()
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from enum import Enum
+
+from service.data_models.onboarding import Location
+
+
+class MapAreaType(Enum):
+    CIRCLE = "circle"
+    CORRIDOR = "corridor"
+    POLYGON = "polygon"
+
+
+class MapAreaRequest(BaseModel):
+    name: str
+    type: MapAreaType
+    points: list[Location]
+    # Radius of a circle, or how far either side of a corridor to cache
+    radiusMiles: float = 1.0
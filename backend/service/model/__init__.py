@@ -1,2 +1,3 @@
 from service.model.hf_client import HuggingFaceGemma3nClient
 from service.model.ollama_client import LangchainOllamaGemmaClient
+from service.model.llm_scheduler import LLMPriority
@@ -0,0 +1,129 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+import itertools
+import asyncio
+import logging
+import heapq
+import time
+
+from langchain_core.language_models import BaseChatModel
+
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority(IntEnum):
+    # Lower value is served first
+    INTERACTIVE = 0
+    MEMORY = 1
+    CHECKLIST = 2
+
+
+class LLMScheduler:
+    # Ollama runs a fixed number of requests in parallel and queues the rest
+    # first come, first served. Admission happens here instead, so a waiting
+    # chat turn always goes ahead of background work
+    def __init__(self, max_concurrency: int, interactive_reserved_slots: int = 0):
+        self.__max_concurrency = max_concurrency
+        # Background work never takes the last slots, a chat turn finds a free
+        # one even while extractions and checklist builds are running
+        self.__background_limit = max(max_concurrency - interactive_reserved_slots, 1)
+        self.__running = 0
+        self.__waiting: list[tuple[int, int, asyncio.Future]] = []
+        self.__sequence = itertools.count()
+
+        self.__requests = {priority: 0 for priority in LLMPriority}
+        self.__queued = {priority: 0 for priority in LLMPriority}
+        self.__waits = {priority: deque(maxlen=1000) for priority in LLMPriority}
+        self.__max_wait = {priority: 0.0 for priority in LLMPriority}
+
+    def __can_start(self, priority: LLMPriority) -> bool:
+        if priority == LLMPriority.INTERACTIVE:
+            return self.__running < self.__max_concurrency
+        return self.__running < self.__background_limit
+
+    def __dispatch(self):
+        while self.__waiting:
+            priority, _, future = self.__waiting[0]
+            if future.done():
+                # Cancelled while queued
+                heapq.heappop(self.__waiting)
+                continue
+            if not self.__can_start(LLMPriority(priority)):
+                break
+            heapq.heappop(self.__waiting)
+            self.__running += 1
+            future.set_result(None)
+
+    async def __acquire(self, priority: LLMPriority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.__waiting, (priority, next(self.__sequence), future))
+        self.__dispatch()
+        if future.done():
+            return
+
+        self.__queued[priority] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the caller went away
+                self.__release()
+            raise
+        finally:
+            self.__queued[priority] -= 1
+
+    def __release(self):
+        self.__running -= 1
+        self.__dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: LLMPriority):
+        started_at = time.monotonic()
+        await self.__acquire(priority)
+        wait = time.monotonic() - started_at
+
+        self.__requests[priority] += 1
+        self.__waits[priority].append(wait)
+        self.__max_wait[priority] = max(self.__max_wait[priority], wait)
+        if wait > 1:
+            logger.info(f"{priority.name.lower()} model call waited {wait:.2f}s")
+
+        try:
+            yield
+        finally:
+            self.__release()
+
+    def stats(self) -> dict:
+        priorities = {}
+        for priority in LLMPriority:
+            waits = sorted(self.__waits[priority])
+            priorities[priority.name.lower()] = {
+                "requests": self.__requests[priority],
+                "queued": self.__queued[priority],
+                "averageWait": (round(sum(waits) / len(waits), 3) if waits else 0),
+                "p95Wait": round(waits[int(len(waits) * 0.95)], 3) if waits else 0,
+                "maxWait": round(self.__max_wait[priority], 3),
+            }
+        return {
+            "maxConcurrency": self.__max_concurrency,
+            "running": self.__running,
+            "priorities": priorities,
+        }
+
+
+class ScheduledChatModel:
+    # Stands in for the chat model inside the agents, every call takes a
+    # scheduler slot first. Callbacks ride along in config, so token
+    # streaming through the graph keeps working
+    def __init__(
+        self, model: BaseChatModel, scheduler: LLMScheduler, priority: LLMPriority
+    ):
+        self.__model = model
+        self.__scheduler = scheduler
+        self.__priority = priority
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        async with self.__scheduler.slot(self.__priority):
+            return await self.__model.ainvoke(messages, config, **kwargs)
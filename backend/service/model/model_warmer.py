@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import logging
+import time
+
+from ollama import AsyncClient
+
+from service.utils.environment import OLLAMA_HOST
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmer:
+    # Ollama unloads a model once its keep_alive runs out, and the next
+    # request pays the full load. An empty prompt loads the model without
+    # generating anything and restarts the keep_alive timer
+    def __init__(self, model_id: str, keep_alive: str, ping_interval: float):
+        self.__client = AsyncClient(host=OLLAMA_HOST)
+        self.__model_id = model_id
+        self.__keep_alive = keep_alive
+        self.__ping_interval = ping_interval
+        self.__enabled = True
+        self.__wake = asyncio.Event()
+        # A ping in flight during unload() would load the model right back
+        self.__lock = asyncio.Lock()
+
+        self.__warm_ups = 0
+        self.__last_load_duration: Optional[float] = None
+        self.__last_ping: Optional[datetime] = None
+        self.__last_error: Optional[str] = None
+
+    async def warm_up(self) -> bool:
+        async with self.__lock:
+            if not self.__enabled:
+                return False
+            started_at = time.perf_counter()
+            try:
+                await self.__client.generate(
+                    model=self.__model_id, prompt="", keep_alive=self.__keep_alive
+                )
+            except Exception as e:
+                self.__last_error = str(e)
+                logger.error(f"Failed to warm up {self.__model_id}: {e}")
+                return False
+
+        self.__warm_ups += 1
+        self.__last_load_duration = time.perf_counter() - started_at
+        self.__last_ping = datetime.now(timezone.utc)
+        self.__last_error = None
+        logger.info(
+            f"{self.__model_id} is warm, load took {self.__last_load_duration:.2f}s"
+        )
+        return True
+
+    async def unload(self):
+        # Frees the memory for the voice model, pings stop until resume()
+        self.__enabled = False
+        async with self.__lock:
+            try:
+                await self.__client.generate(model=self.__model_id, keep_alive=0)
+                logger.info(f"Unloaded {self.__model_id}")
+            except Exception as e:
+                logger.error(f"Failed to unload {self.__model_id}: {e}")
+
+    def resume(self):
+        self.__enabled = True
+        self.__wake.set()
+
+    async def run(self):
+        while True:
+            if self.__enabled:
+                # Retried quickly until Ollama is up, then only while idle
+                warm = await self.warm_up()
+                timeout = self.__ping_interval if warm else 5
+            else:
+                timeout = None
+
+            try:
+                await asyncio.wait_for(self.__wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.__wake.clear()
+
+    async def residency(self) -> dict:
+        # Asks Ollama which models are loaded right now
+        try:
+            loaded = (await self.__client.ps()).models
+        except Exception as e:
+            return {"resident": False, "error": str(e)}
+
+        for model in loaded:
+            if model.model == self.__model_id:
+                return {
+                    "resident": True,
+                    "expiresAt": model.expires_at,
+                    "sizeVram": model.size_vram,
+                }
+        return {"resident": False}
+
+    def stats(self) -> dict:
+        return {
+            "model": self.__model_id,
+            "keepAlive": self.__keep_alive,
+            "warmUps": self.__warm_ups,
+            "lastLoadDuration": self.__last_load_duration,
+            "lastPing": self.__last_ping.isoformat() if self.__last_ping else None,
+            "lastError": self.__last_error,
+        }
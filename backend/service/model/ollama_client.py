@@ -2,7 +2,13 @@ from langchain_ollama import ChatOllama
 import logging
 
 from service.utils.singleton import singleton
-from service.utils.environment import OLLAMA_HOST
+from service.utils.environment import (
+    OLLAMA_HOST,
+    OLLAMA_NUM_PARALLEL,
+    OLLAMA_KEEP_ALIVE,
+)
+from service.utils.constants import LLM_INTERACTIVE_RESERVED_SLOTS
+from service.model.llm_scheduler import LLMScheduler, LLMPriority, ScheduledChatModel
 
 
 logger = logging.getLogger(__name__)
@@ -13,5 +19,16 @@ class LangchainOllamaGemmaClient:
     MODEL_ID = "gemma3n:latest"
 
     def __init__(self):
-        self.model = ChatOllama(model=self.MODEL_ID, base_url=OLLAMA_HOST)
+        # Every call restarts the keep_alive timer of the loaded model
+        self.model = ChatOllama(
+            model=self.MODEL_ID, base_url=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE
+        )
+        self.scheduler = LLMScheduler(
+            max_concurrency=OLLAMA_NUM_PARALLEL,
+            interactive_reserved_slots=LLM_INTERACTIVE_RESERVED_SLOTS,
+        )
         logger.info("Loaded langchain ollama Gemma3n model.")
+
+    def scheduled(self, priority: LLMPriority) -> ScheduledChatModel:
+        # All agents share the one Ollama instance through the scheduler
+        return ScheduledChatModel(self.model, self.scheduler, priority)
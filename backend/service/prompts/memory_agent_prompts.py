@@ -48,3 +48,11 @@ Input: "The sky is really dark today."
 Output: {{}}
 
 Now, extract information from this message. Return only valid JSON with no extra text:"""
+
+MEMORY_AGENT_BATCH_PROMPT = """You will receive several messages at once, each starting with its number in square brackets, e.g. [1], [2].
+Extract information from every message on its own and return a single JSON object that maps each message number to the JSON you would return for that message alone.
+
+Input: "[1] Hi there! [2] My name is Alex and I have two dogs."
+Output: {"1": {}, "2": {"name": "Alex", "dependents": "2 dogs"}}
+
+Return only valid JSON with no extra text:"""
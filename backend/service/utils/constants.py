@@ -18,4 +18,73 @@ MAP_DB_NAME = "offline_map.db"
 CACHED_MAP_RADIUS = 10  # Miles
 CACHED_MAP_MIN_ZOOM_LEVEL = 0
 CACHED_MAP_MAX_ZOOM_LEVEL = 15
-WAIT_BETWEEN_RETRIES = 15 * 60 * 60  # 15 minutes
+CACHED_MAP_PREFERRED_ZOOM_LEVEL = 13  # Street level, downloaded first in a ring
+CACHED_MAP_RING_WIDTH = 1.0  # Miles
+CACHED_MAP_MAX_TILE_RETRIES = 5
+MAP_AREA_MAX_EXTENT_MILES = 100  # Bounding box diagonal of one requested area
+WAIT_BETWEEN_RETRIES = 15 * 60  # 15 minutes, longest wait between map download retries
+MIN_WAIT_BETWEEN_RETRIES = 60  # Seconds before the first map download retry
+MAP_TILE_HTTP_MAX_AGE = 7 * 24 * 60 * 60  # 7 days
+MAP_DB_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,  # 256 MiB
+    "cache_size": -16 * 1024,  # 16 MiB, negative means KiB
+    "temp_store": "MEMORY",
+    "busy_timeout": 30 * 1000,  # 30 seconds
+}
+
+TILE_WRITER_QUEUE_SIZE = 2000
+TILE_WRITER_BATCH_SIZE = 256
+TILE_WRITER_FLUSH_INTERVAL = 1.0  # Seconds
+TILE_WRITER_FULL_POLL_INTERVAL = 0.05  # Seconds between retries on a full queue
+
+MAP_DOWNLOAD_INITIAL_CONCURRENCY = 16
+MAP_DOWNLOAD_MIN_CONCURRENCY = 2
+MAP_DOWNLOAD_MAX_CONCURRENCY = 64
+MAP_DOWNLOAD_LATENCY_TARGET = 2.0  # Seconds
+MAP_DOWNLOAD_PROGRESS_INTERVAL = 500  # Tiles between progress saves
+MAP_DOWNLOAD_MAX_THROTTLE_RETRIES = 5  # Throttled attempts before a tile fails
+
+MBTILES_CHUNK_SIZE = 1000  # Tiles per executemany while importing/exporting
+
+MEMORY_SCAN_COUNT = 1000  # Keys hinted per SCAN round trip
+MEMORY_FETCH_BATCH_SIZE = 500  # Keys per JSON.MGET round trip
+
+MEMORY_BATCH_WINDOW = 2.0  # Seconds to wait for follow-up messages
+MEMORY_BATCH_MAX_MESSAGES = 8
+MEMORY_BATCH_MAX_TOKENS = 1024  # Estimated tokens of user text per batch
+MEMORY_EXTRACTION_CONCURRENCY = 2  # Extractions running at the same time
+
+MEMORY_COMPACTED_KEY = "compacted"  # Store key of the merged memory
+MEMORY_COMPACTION_INTERVAL = 10 * 60  # Seconds between compaction checks
+MEMORY_COMPACTION_THRESHOLD = 8  # Memories before a compaction is worth it
+MEMORY_COMPACT_MAX_FIELDS = 32  # Fields kept in the merged memory
+MEMORY_HISTORY_MAX_ENTRIES = 10  # Replaced values kept per field
+
+MEMORY_RETRIEVAL_TOP_K = 12  # Memory facts attached to a chat prompt
+MEMORY_RETRIEVAL_TOKEN_BUDGET = 400  # Estimated tokens of attached facts
+MEMORY_RETRIEVAL_CACHE_SIZE = 10000  # Tokenized facts kept between turns
+
+MEMORY_QUEUE_MAX_LENGTH = 1000  # Messages queued or in flight
+MEMORY_QUEUE_CLAIM_IDLE = 5 * 60  # Seconds before a dead consumer's entry is taken over
+MEMORY_QUEUE_BLOCK = 5.0  # Seconds a single stream read blocks
+MEMORY_QUEUE_RECLAIM_INTERVAL = 60  # Seconds between checks for stale pending entries
+MEMORY_QUEUE_MAX_DELIVERIES = 5  # Deliveries before an entry is dead-lettered
+
+PROMPT_SYSTEM_TOKEN_BUDGET = 2048  # Estimated tokens of the system prompt
+PROMPT_PROFILE_TOKEN_BUDGET = 512  # Estimated tokens of the onboarding profile
+PROMPT_MEMORY_TOKEN_BUDGET = 512  # Estimated tokens of the attached memories
+
+LLM_INTERACTIVE_RESERVED_SLOTS = 1  # Model slots background agents leave free for chat
+
+CHAT_HISTORY_TOKEN_BUDGET = 1024  # Estimated tokens of past messages sent with a turn
+CHAT_HISTORY_KEEP_MESSAGES = 6  # Latest messages kept verbatim on summarizing
+CHAT_SUMMARY_TOKEN_BUDGET = 256  # Estimated tokens of the rolling summary
+CHAT_HISTORY_TTL = 7 * 24 * 60  # Minutes a chat thread is kept in Redis
+
+RESPONSE_CACHE_TTL = 6 * 60 * 60  # Seconds a cached answer is replayed
+RESPONSE_CACHE_SIMILARITY = 0.85  # Token overlap for a near-duplicate question
+RESPONSE_CACHE_MAX_ENTRIES = 500  # Questions compared per disaster context
+RESPONSE_CACHE_MIN_TOKENS = 3  # Content words a question needs to be cached
+
+MODEL_PING_INTERVAL = 5 * 60  # Seconds between pings, below OLLAMA_KEEP_ALIVE
@@ -0,0 +1,100 @@
+import logging
+import threading
+
+from service.utils.map_store import MapStore, TileBounds
+from service.utils.constants import CACHED_MAP_MAX_TILE_RETRIES
+
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadFrontier:
+    def __init__(
+        self,
+        map_store: MapStore,
+        bounds_per_zoom: dict[int, TileBounds],
+        max_retries: int = CACHED_MAP_MAX_TILE_RETRIES,
+    ):
+        self.__map_store = map_store
+        self.__max_retries = max_retries
+        self.__lock = threading.Lock()
+
+        self.__bounds: dict[int, TileBounds] = bounds_per_zoom
+        self.__bitmaps: dict[int, bytearray] = {}
+
+        stored_plan = map_store.get_download_plan()
+        for zoom, bounds in bounds_per_zoom.items():
+            stored = stored_plan.get(zoom)
+            if stored is not None and stored[0] == bounds:
+                self.__bitmaps[zoom] = bytearray(stored[1])
+                continue
+
+            # No plan for this zoom yet (first run, or a database written
+            # before the frontier existed), seed it from the stored tiles once
+            logger.info(f"Planning zoom {zoom} from existing tiles")
+            self.__bitmaps[zoom] = bytearray((self.__tile_count(bounds) + 7) // 8)
+            for x, y in map_store.get_tile_for_zoom(zoom):
+                self.__set(zoom, x, y)
+
+        self.__failed: dict[tuple[int, int, int], int] = map_store.get_failed_tiles()
+        self.__recovered: list[tuple[int, int, int]] = []
+
+    @staticmethod
+    def __tile_count(bounds: TileBounds) -> int:
+        x_min, y_min, x_max, y_max = bounds
+        return (x_max - x_min + 1) * (y_max - y_min + 1)
+
+    def __bit(self, z: int, x: int, y: int) -> int | None:
+        bounds = self.__bounds.get(z)
+        if bounds is None:
+            return None
+
+        x_min, y_min, x_max, y_max = bounds
+        if not (x_min <= x <= x_max and y_min <= y <= y_max):
+            return None
+        return (x - x_min) * (y_max - y_min + 1) + (y - y_min)
+
+    def __set(self, z: int, x: int, y: int):
+        bit = self.__bit(z, x, y)
+        if bit is not None:
+            self.__bitmaps[z][bit // 8] |= 1 << (bit % 8)
+
+    def is_complete(self, z: int, x: int, y: int) -> bool:
+        bit = self.__bit(z, x, y)
+        if bit is None:
+            return False
+        return bool(self.__bitmaps[z][bit // 8] & (1 << (bit % 8)))
+
+    def should_retry(self, z: int, x: int, y: int) -> bool:
+        with self.__lock:
+            return self.__failed.get((z, x, y), 0) < self.__max_retries
+
+    def mark_written(self, tiles: list[tuple[int, int, int]]):
+        # Called by the tile writer once the tiles are committed to disk
+        with self.__lock:
+            for z, x, y in tiles:
+                self.__set(z, x, y)
+                if self.__failed.pop((z, x, y), None) is not None:
+                    self.__recovered.append((z, x, y))
+
+    def mark_failed(self, z: int, x: int, y: int):
+        with self.__lock:
+            self.__failed[(z, x, y)] = self.__failed.get((z, x, y), 0) + 1
+
+    def has_retryable_failures(self) -> bool:
+        with self.__lock:
+            return any(
+                retries < self.__max_retries for retries in self.__failed.values()
+            )
+
+    def save(self):
+        with self.__lock:
+            plan = {
+                zoom: (self.__bounds[zoom], bytes(bitmap))
+                for zoom, bitmap in self.__bitmaps.items()
+            }
+            failed = dict(self.__failed)
+            recovered = self.__recovered
+            self.__recovered = []
+
+        self.__map_store.save_download_frontier(plan, failed, recovered)
@@ -5,9 +5,23 @@ OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 MONGO_HOST = os.getenv("MONGO_HOST", "mongodb://localhost:27017/")
 REDIS_HOST = os.getenv("REDIS_HOST", "redis://localhost:6379")
 LANGFUSE_URL = os.getenv("LANGFUSE_URL", "http://localhost:3000")
+# Match the Ollama server's own setting, requests beyond it only queue there
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+# How long an idle model stays loaded
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
 LANGFUSE_PUBLIC_KEY = os.getenv("LANGFUSE_PUBLIC_KEY", None)
 LANGFUSE_SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY", None)
 
 MAP_TILE_SERVER = os.getenv("MAP_TILE_SERVER", "https://tile.openstreetmap.org")
+MAP_TILE_RATE_LIMIT = float(os.getenv("MAP_TILE_RATE_LIMIT", "20"))  # Per second
 LOAD_PROMPTS_FROM_DB = os.getenv("LOAD_PROMPTS_FROM_DB", "false").lower() == "true"
+# drop-oldest or reject
+MEMORY_QUEUE_OVERFLOW_POLICY = os.getenv("MEMORY_QUEUE_OVERFLOW_POLICY", "drop-oldest")
+MEMORY_PREFILTER_ENABLED = (
+    os.getenv("MEMORY_PREFILTER_ENABLED", "true").lower() == "true"
+)
+MAP_TILE_CACHE_BYTES = int(
+    os.getenv("MAP_TILE_CACHE_BYTES", str(32 * 1024 * 1024))  # 32 MiB
+)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
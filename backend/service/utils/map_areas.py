@@ -0,0 +1,219 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+import math
+
+from service.utils.tile_math import MILES_PER_DEGREE, tile_box
+
+
+class Overlap(Enum):
+    OUTSIDE = "outside"
+    PARTIAL = "partial"
+    INSIDE = "inside"
+
+
+Point = tuple[float, float]
+# (north, south, west, east) in degrees
+TileBox = tuple[float, float, float, float]
+
+
+def _segment_point_distance(a: Point, b: Point, p: Point) -> float:
+    ax, ay = a
+    bx, by = b
+    px, py = p
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else ((px - ax) * dx + (py - ay) * dy) / length_sq
+    t = min(max(t, 0.0), 1.0)
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _orientation(a: Point, b: Point, c: Point) -> float:
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _segments_intersect(a: Point, b: Point, c: Point, d: Point) -> bool:
+    d1 = _orientation(c, d, a)
+    d2 = _orientation(c, d, b)
+    d3 = _orientation(a, b, c)
+    d4 = _orientation(a, b, d)
+    return ((d1 > 0) != (d2 > 0)) and ((d3 > 0) != (d4 > 0))
+
+
+def _point_in_polygon(point: Point, polygon: list[Point]) -> bool:
+    x, y = point
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class MapArea(ABC):
+    # Geometry is projected to a local plane in miles around the reference
+    # latitude, precise enough for the few hundred miles a device caches
+    def __init__(self, points: list[tuple[float, float]]):
+        self.__ref_lat = sum(lat for lat, _ in points) / len(points)
+        self.__lon_scale = MILES_PER_DEGREE * math.cos(math.radians(self.__ref_lat))
+        self.points = [self.project(lat, lon) for lat, lon in points]
+
+    def project(self, lat: float, lon: float) -> Point:
+        return (lon * self.__lon_scale, lat * MILES_PER_DEGREE)
+
+    def project_box(self, box: TileBox) -> list[Point]:
+        north, south, west, east = box
+        return [
+            self.project(north, west),
+            self.project(north, east),
+            self.project(south, east),
+            self.project(south, west),
+        ]
+
+    @property
+    def anchor(self) -> Point:
+        # Tiles closest to this point are downloaded first
+        return self.points[0]
+
+    def distance_from_anchor(self, box: TileBox) -> float:
+        corners = self.project_box(box)
+        min_x, max_x = corners[0][0], corners[1][0]
+        min_y, max_y = corners[2][1], corners[0][1]
+        ax, ay = self.anchor
+        return math.hypot(
+            ax - min(max(ax, min_x), max_x), ay - min(max(ay, min_y), max_y)
+        )
+
+    @property
+    def extent_miles(self) -> float:
+        # Diagonal of the bounding box, what bounds the tiles to download
+        xs = [x for x, _ in self.points]
+        ys = [y for _, y in self.points]
+        return math.hypot(max(xs) - min(xs), max(ys) - min(ys))
+
+    @abstractmethod
+    def classify(self, box: TileBox) -> Overlap:
+        pass
+
+
+class CircleArea(MapArea):
+    def __init__(self, lat: float, lon: float, radius_miles: float):
+        super().__init__([(lat, lon)])
+        self.radius_miles = radius_miles
+
+    @property
+    def extent_miles(self) -> float:
+        return 2 * self.radius_miles
+
+    def classify(self, box: TileBox) -> Overlap:
+        if self.distance_from_anchor(box) > self.radius_miles:
+            return Overlap.OUTSIDE
+
+        cx, cy = self.anchor
+        farthest = max(math.hypot(x - cx, y - cy) for x, y in self.project_box(box))
+        return Overlap.INSIDE if farthest <= self.radius_miles else Overlap.PARTIAL
+
+
+class CorridorArea(MapArea):
+    def __init__(self, points: list[tuple[float, float]], buffer_miles: float):
+        super().__init__(points)
+        self.buffer_miles = buffer_miles
+        self.__segments = list(zip(self.points, self.points[1:])) or [
+            (self.points[0], self.points[0])
+        ]
+
+    @property
+    def extent_miles(self) -> float:
+        return super().extent_miles + 2 * self.buffer_miles
+
+    def classify(self, box: TileBox) -> Overlap:
+        corners = self.project_box(box)
+        edges = list(zip(corners, corners[1:] + corners[:1]))
+        min_x, max_x = corners[0][0], corners[1][0]
+        min_y, max_y = corners[2][1], corners[0][1]
+
+        nearest = math.inf
+        for a, b in self.__segments:
+            # A capsule is convex, so a box with every corner in it is inside
+            if all(
+                _segment_point_distance(a, b, corner) <= self.buffer_miles
+                for corner in corners
+            ):
+                return Overlap.INSIDE
+
+            if (min_x <= a[0] <= max_x and min_y <= a[1] <= max_y) or any(
+                _segments_intersect(a, b, c, d) for c, d in edges
+            ):
+                return Overlap.PARTIAL
+
+            nearest = min(
+                nearest,
+                *[_segment_point_distance(a, b, corner) for corner in corners],
+                *[_segment_point_distance(c, d, a) for c, d in edges],
+                *[_segment_point_distance(c, d, b) for c, d in edges],
+            )
+
+        return Overlap.PARTIAL if nearest <= self.buffer_miles else Overlap.OUTSIDE
+
+
+class PolygonArea(MapArea):
+    def classify(self, box: TileBox) -> Overlap:
+        corners = self.project_box(box)
+        edges = list(zip(corners, corners[1:] + corners[:1]))
+        min_x, max_x = corners[0][0], corners[1][0]
+        min_y, max_y = corners[2][1], corners[0][1]
+
+        polygon_edges = list(zip(self.points, self.points[1:] + self.points[:1]))
+        crosses = any(
+            _segments_intersect(a, b, c, d) for a, b in polygon_edges for c, d in edges
+        )
+        vertex_inside = any(
+            min_x <= x <= max_x and min_y <= y <= max_y for x, y in self.points
+        )
+        corners_inside = [_point_in_polygon(corner, self.points) for corner in corners]
+
+        if all(corners_inside) and not crosses and not vertex_inside:
+            return Overlap.INSIDE
+        if crosses or vertex_inside or any(corners_inside):
+            return Overlap.PARTIAL
+        return Overlap.OUTSIDE
+
+
+def build_map_area(
+    area_type: str, points: list[tuple[float, float]], radius_miles: float
+) -> MapArea:
+    if area_type == "circle":
+        lat, lon = points[0]
+        return CircleArea(lat, lon, radius_miles)
+    if area_type == "corridor":
+        return CorridorArea(points, radius_miles)
+    if area_type == "polygon":
+        return PolygonArea(points)
+    raise ValueError(f"Unknown map area type: '{area_type}'")
+
+
+def cover_tiles(
+    area: MapArea, min_zoom: int, max_zoom: int
+) -> list[tuple[int, int, int]]:
+    # Quadtree walk from the world tile: children of a tile fully inside the
+    # area are taken without further tests, children of an outside tile are
+    # never visited, so only the area's border is examined at every zoom
+    tiles = []
+    stack = [(0, 0, 0, False)]
+    while stack:
+        z, x, y, known_inside = stack.pop()
+        if not known_inside:
+            overlap = area.classify(tile_box(z, x, y))
+            if overlap == Overlap.OUTSIDE:
+                continue
+            known_inside = overlap == Overlap.INSIDE
+
+        if z >= min_zoom:
+            tiles.append((z, x, y))
+        if z < max_zoom:
+            for dx in (0, 1):
+                for dy in (0, 1):
+                    stack.append((z + 1, 2 * x + dx, 2 * y + dy, known_inside))
+    return tiles
@@ -1,76 +1,142 @@
-import math
+from collections import deque
+from enum import Enum
 import aiohttp
 import logging
 import asyncio
+import time
 
 from service.utils.map_store import MapStore
-from service.utils.environment import MAP_TILE_SERVER
+from service.utils.tile_writer import TileWriter, TileWriterError
+from service.utils.tile_scheduler import TileScheduler, PlannedTile
+from service.utils.download_frontier import DownloadFrontier
+from service.utils.map_areas import build_map_area
+from service.utils.rate_control import (
+    AdaptiveConcurrencyLimiter,
+    TokenBucket,
+    parse_retry_after,
+)
+from service.utils.environment import MAP_TILE_SERVER, MAP_TILE_RATE_LIMIT
+from service.utils.constants import (
+    MAP_DOWNLOAD_INITIAL_CONCURRENCY,
+    MAP_DOWNLOAD_MIN_CONCURRENCY,
+    MAP_DOWNLOAD_MAX_CONCURRENCY,
+    MAP_DOWNLOAD_LATENCY_TARGET,
+    MAP_DOWNLOAD_PROGRESS_INTERVAL,
+    MAP_DOWNLOAD_MAX_THROTTLE_RETRIES,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+class TileResult(Enum):
+    OK = "ok"
+    FAILED = "failed"
+    THROTTLED = "throttled"
+
+
 class MapDownloader:
-    def __init__(self):
+    def __init__(
+        self,
+        tile_server: str = MAP_TILE_SERVER,
+        rate_limit: float = MAP_TILE_RATE_LIMIT,
+    ):
         self.__map_store = MapStore(create_if_no_exists=True)
 
-        self.__tile_server = MAP_TILE_SERVER
+        self.__tile_server = tile_server
 
         self.__consecutive_errors = 0
         self.__max_consecutive_errors = 20
-
-    def __deg2num(self, lat_deg: float, lon_deg: float, zoom: int) -> tuple[int, int]:
-        lat_radians = math.radians(lat_deg)
-        n = 2.0**zoom
-        x = int((lon_deg + 180.0) / 360.0 * n)
-        y = int((1.0 - math.asinh(math.tan(lat_radians)) / math.pi) / 2.0 * n)
-        return (x, y)
-
-    def __calculate_bounds(
-        self, center_lat: float, center_lon: float, radius_miles: float, zoom: int
-    ) -> tuple[int, int, int, int]:
-        # 1 degree lat = 69.0 miles
-        lat_offset = radius_miles / 69.0
-        lon_offset = radius_miles / (69.0 * math.cos(math.radians(center_lat)))
-
-        north = center_lat + lat_offset
-        south = center_lat - lat_offset
-        east = center_lon + lon_offset
-        west = center_lon - lon_offset
-
-        x_min, y_min = self.__deg2num(north, west, zoom)
-        x_max, y_max = self.__deg2num(south, east, zoom)
-
-        return (x_min, y_min, x_max, y_max)
+        self.__throttle_retries: dict[PlannedTile, int] = {}
+
+        self.__bucket = TokenBucket(rate=rate_limit)
+        self.__limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=MAP_DOWNLOAD_INITIAL_CONCURRENCY,
+            min_limit=MAP_DOWNLOAD_MIN_CONCURRENCY,
+            max_limit=MAP_DOWNLOAD_MAX_CONCURRENCY,
+            latency_target=MAP_DOWNLOAD_LATENCY_TARGET,
+        )
 
     async def __download_tile(
-        self, session: aiohttp.ClientSession, z: int, x: int, y: int
-    ) -> bool:
+        self,
+        session: aiohttp.ClientSession,
+        tile_writer: TileWriter,
+        z: int,
+        x: int,
+        y: int,
+    ) -> TileResult:
         url = f"{self.__tile_server}/{z}/{x}/{y}.png"
 
+        await self.__bucket.acquire()
+        started_at = time.monotonic()
         try:
             async with session.get(url) as response:
                 if response.status == 200:
                     tile_data = await response.read()
-                    self.__map_store.store_tile(x, y, z, tile_data)
+                    self.__limiter.on_success(time.monotonic() - started_at)
+                    await tile_writer.put(z, x, y, tile_data)
                     self.__consecutive_errors = 0
-                    return True
-                else:
-                    logger.error(
-                        f"Failed to download tile {z}/{x}/{y}: {response.status}"
-                    )
-                    return False
+                    return TileResult.OK
+
+                logger.error(f"Failed to download tile {z}/{x}/{y}: {response.status}")
+                if response.status == 429 or response.status >= 500:
+                    self.__limiter.on_congestion()
+
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    logger.info(f"Tile server asked to retry after {retry_after}s")
+                    self.__bucket.pause(retry_after)
+
+                if response.status in (429, 503):
+                    return TileResult.THROTTLED
+                return TileResult.FAILED
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Network error downloading tile {z}/{x}/{y}: {e}")
+            self.__limiter.on_congestion()
             self.__consecutive_errors += 1
+            return TileResult.FAILED
+        except TileWriterError:
+            # Never counted against the tile, the whole download stops
+            raise
         except Exception as e:
-            logger.error(f"Failed to download tile {z}/{x}/{y}: {response.status}")
-            return False
+            logger.error(f"Failed to download tile {z}/{x}/{y}: {e}")
+            return TileResult.FAILED
 
-    async def __gather_tasks(self, tasks: list[bool]) -> int:
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        batch_processed = sum(int(r) for r in results)
-        return batch_processed
+    async def __worker(
+        self,
+        session: aiohttp.ClientSession,
+        tile_writer: TileWriter,
+        pending: deque[PlannedTile],
+        on_done,
+    ):
+        # Sliding window: a slow tile only holds its own slot, never a batch
+        while pending:
+            if self.__consecutive_errors > self.__max_consecutive_errors:
+                return
+            tile_writer.raise_if_failed()
+
+            async with self.__limiter:
+                if not pending:
+                    return
+                tile = pending.popleft()
+                _, z, x, y = tile
+                result = await self.__download_tile(session, tile_writer, z, x, y)
+
+            if result == TileResult.THROTTLED:
+                retries = self.__throttle_retries.get(tile, 0) + 1
+                if retries <= MAP_DOWNLOAD_MAX_THROTTLE_RETRIES:
+                    # Throttling is not the tile's fault, keep its place in line
+                    self.__throttle_retries[tile] = retries
+                    pending.appendleft(tile)
+                    continue
+
+                # A server that keeps refusing is treated as failing, so the
+                # area gives up and the downloader backs off
+                self.__throttle_retries.pop(tile, None)
+                self.__consecutive_errors += 1
+                result = TileResult.FAILED
+
+            await on_done(tile, result)
 
     async def download_area(
         self,
@@ -80,97 +146,139 @@ class MapDownloader:
         min_zoom: int,
         max_zoom: int,
     ) -> bool:
-        total_tiles = 0
+        self.__map_store.update_lat_lon(center_lat, center_lon)
+        self.__throttle_retries.clear()
+
+        areas = self.__map_store.get_areas()
+        extra_areas = [
+            build_map_area(area["type"], area["points"], area["radiusMiles"])
+            for area in areas
+        ]
+
+        scheduler = await asyncio.to_thread(
+            TileScheduler,
+            center_lat,
+            center_lon,
+            radius_miles,
+            min_zoom,
+            max_zoom,
+            extra_areas=extra_areas,
+        )
+        total_tiles = len(scheduler)
+
+        logger.info(
+            f"Processing {total_tiles} tiles for {radius_miles}-mile radius around ({center_lat}, {center_lon}) and {len(extra_areas)} extra areas"
+        )
+        logger.info(f"Zoom levels: {min_zoom} to {max_zoom}")
+
+        # Only the persisted frontier is consulted, resuming never scans tiles
+        frontier = await asyncio.to_thread(
+            DownloadFrontier, self.__map_store, scheduler.bounds
+        )
+
         processed_tiles = 0
-        tile_info_per_zoom_level = {}
+        pending = deque()
+        for tile in scheduler.tiles:
+            _, z, x, y = tile
+            if frontier.is_complete(z, x, y):
+                scheduler.mark_complete(tile)
+                processed_tiles += 1
+            elif frontier.should_retry(z, x, y):
+                pending.append(tile)
 
-        self.__map_store.update_lat_lon(center_lat, center_lon)
+        logger.info(
+            f"Resuming with {len(pending)} missing tiles, {processed_tiles} already cached"
+        )
+
+        finished_since_save = 0
 
-        for zoom in range(min_zoom, max_zoom + 1):
-            x_min, y_min, x_max, y_max = self.__calculate_bounds(
-                center_lat, center_lon, radius_miles, zoom
+        async def save_progress():
+            download_status = round(processed_tiles / total_tiles * 100, 1)
+            await asyncio.to_thread(
+                self.__map_store.update_download_status,
+                download_status,
+                scheduler.coverage_radius,
             )
-            this_zoom_tile_count = (x_max - x_min + 1) * (y_max - y_min + 1)
-            tile_info_per_zoom_level[zoom] = (
-                (x_min, y_min),
-                (x_max, y_max),
-                this_zoom_tile_count,
+            await asyncio.to_thread(frontier.save)
+
+            logger.info(
+                f"Progress: {processed_tiles}/{total_tiles} ({download_status}%), covered {scheduler.coverage_radius} miles, concurrency {self.__limiter.limit}"
             )
-            total_tiles += this_zoom_tile_count
 
-        logger.info(
-            f"Processing {total_tiles} tiles for {radius_miles}-mile radius around ({center_lat}, {center_lon})"
-        )
-        logger.info(f"Zoom levels: {min_zoom} to {max_zoom}")
+        async def on_done(tile: PlannedTile, result: TileResult):
+            nonlocal processed_tiles, finished_since_save
+            if result == TileResult.OK:
+                scheduler.mark_complete(tile)
+                processed_tiles += 1
+            else:
+                frontier.mark_failed(*tile[1:])
+
+            finished_since_save += 1
+            if finished_since_save >= MAP_DOWNLOAD_PROGRESS_INTERVAL:
+                finished_since_save = 0
+                await save_progress()
 
         headers = {"User-Agent": "OfflineMapDownloader/1.0"}
-        connector = aiohttp.TCPConnector(limit=500)
+        connector = aiohttp.TCPConnector(limit=MAP_DOWNLOAD_MAX_CONCURRENCY)
         timeout = aiohttp.ClientTimeout(total=60)
 
+        tile_writer = TileWriter(self.__map_store, on_flush=frontier.mark_written)
+        tile_writer.start()
+
         try:
             async with aiohttp.ClientSession(
                 headers=headers, connector=connector, timeout=timeout
             ) as session:
-                for zoom in range(min_zoom, max_zoom + 1):
-                    (x_min, y_min), (x_max, y_max), this_zoom_count = (
-                        tile_info_per_zoom_level[zoom]
-                    )
-                    logger.info(
-                        f"Processing zoom level {zoom}: {this_zoom_count} tiles"
-                    )
-                    logger.info(f"Checking existing tiles for zoom {zoom}")
-                    existing_tiles = self.__map_store.get_tile_for_zoom(zoom)
-                    logger.info(
-                        f"Found {len(existing_tiles)} existing tiles for zoom {zoom}"
-                    )
-
-                    tasks = []
-                    for x in range(x_min, x_max + 1):
-                        for y in range(y_min, y_max + 1):
-                            if (x, y) in existing_tiles:
-                                processed_tiles += 1
-                                continue
-
-                            tasks.append(self.__download_tile(session, zoom, x, y))
-
-                            if len(tasks) >= 500:
-                                processed_tiles += await self.__gather_tasks(tasks)
-
-                                download_status = round(
-                                    processed_tiles / total_tiles * 100, 1
-                                )
-                                self.__map_store.update_download_status(download_status)
-
-                                tasks = []
-
-                                await asyncio.sleep(0.5)
-
-                                if (
-                                    self.__consecutive_errors
-                                    > self.__max_consecutive_errors
-                                ):
-                                    raise aiohttp.ClientError(
-                                        "Too many consecutive errors, try later!"
-                                    )
-
-                                logger.info(
-                                    f"Progress: {processed_tiles}/{total_tiles} ({download_status}%)"
-                                )
-
-                    if tasks:
-                        processed_tiles += await self.__gather_tasks(tasks)
-                        download_status = round(processed_tiles / total_tiles * 100, 1)
-                        self.__map_store.update_download_status(download_status)
-
-                    logger.info(f"Completed zoom level {zoom}")
+                # Tiles are ordered center-outward, so a cut off download
+                # still leaves the area around the user covered at all zooms
+                results = await asyncio.gather(
+                    *[
+                        self.__worker(session, tile_writer, pending, on_done)
+                        for _ in range(MAP_DOWNLOAD_MAX_CONCURRENCY)
+                    ],
+                    # A failing writer stops every worker, wait for all of
+                    # them before the session closes under their feet
+                    return_exceptions=True,
+                )
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+
+            # Every queued tile must be on disk before the download is complete
+            await tile_writer.close()
+            tile_writer.raise_if_failed()
+            await save_progress()
+
+            if self.__consecutive_errors > self.__max_consecutive_errors:
+                raise aiohttp.ClientError("Too many consecutive errors, try later!")
+
+            if frontier.has_retryable_failures():
+                logger.error("Some tiles failed to download, retrying later")
+                return False
+
+            self.__map_store.mark_areas_complete([area["id"] for area in areas])
+            if not all(area["complete"] for area in self.__map_store.get_areas()):
+                logger.info("New map areas were queued, downloading them too")
+                return await self.download_area(
+                    center_lat, center_lon, radius_miles, min_zoom, max_zoom
+                )
 
             self.__map_store.mark_download_complete()
 
             return True
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, TileWriterError) as e:
+            # Retryable, the tiles a failed write lost are planned again
             logger.error(e)
+            await tile_writer.close()
+            await asyncio.to_thread(frontier.save)
             return False
         except Exception as e:
             logger.error(e)
+            await tile_writer.close()
+            await asyncio.to_thread(frontier.save)
             # If not network error, then it's irrecoverable or retryable
             return True
+        finally:
+            # Also stops the writer thread when the download task is
+            # cancelled, closing twice is a no-op
+            await tile_writer.close()
@@ -1,8 +1,204 @@
+from typing import Iterable, Iterator
+import hashlib
+import json
+import logging
 import sqlite3
 import os
 
-from service.utils.singleton import singleton
-from service.utils.constants import MAP_DB_NAME
+from service.utils.constants import MAP_DB_NAME, MAP_DB_PRAGMAS
+from service.utils.environment import MAP_TILE_CACHE_BYTES
+from service.utils.sqlite_pool import SQLiteConnectionPool
+from service.utils.tile_cache import CachedTile, TileCache
+
+
+TILE_TABLE = "tiles"
+BLOB_TABLE = "blobs"
+STATUS_TABLE = "status"
+PLAN_TABLE = "download_plan"
+FAILED_TILE_TABLE = "failed_tiles"
+AREA_TABLE = "areas"
+
+# (x_min, y_min, x_max, y_max) of the tiles planned for one zoom level
+TileBounds = tuple[int, int, int, int]
+
+
+logger = logging.getLogger(__name__)
+
+
+def tile_hash(tile_data: bytes) -> str:
+    return hashlib.sha256(tile_data).hexdigest()
+
+
+def _migrate_add_tile_hash(conn: sqlite3.Connection):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({TILE_TABLE})")]
+    if "hash" not in columns:
+        conn.execute(f"ALTER TABLE {TILE_TABLE} ADD COLUMN hash TEXT")
+
+    conn.create_function("tile_hash", 1, tile_hash, deterministic=True)
+    conn.execute(f"UPDATE {TILE_TABLE} SET hash=tile_hash(data) WHERE hash IS NULL")
+
+    # Covering index so ETag lookups never touch the blob pages
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {TILE_TABLE}_hash ON {TILE_TABLE} (z, x, y, hash)"
+    )
+
+
+def _migrate_content_addressed_blobs(conn: sqlite3.Connection) -> bool:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {BLOB_TABLE} (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        )
+    """
+    )
+
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({TILE_TABLE})")]
+    if "data" in columns:
+        conn.execute(
+            f"INSERT OR IGNORE INTO {BLOB_TABLE} (hash, data) SELECT hash, data FROM {TILE_TABLE}"
+        )
+        conn.execute(
+            f"""
+            CREATE TABLE {TILE_TABLE}_new (
+                z INTEGER,
+                x INTEGER,
+                y INTEGER,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (z, x, y)
+            ) WITHOUT ROWID
+        """
+        )
+        conn.execute(
+            f"INSERT INTO {TILE_TABLE}_new (z, x, y, hash) SELECT z, x, y, hash FROM {TILE_TABLE}"
+        )
+        conn.execute(f"DROP INDEX IF EXISTS {TILE_TABLE}_hash")
+        conn.execute(f"DROP TABLE {TILE_TABLE}")
+        conn.execute(f"ALTER TABLE {TILE_TABLE}_new RENAME TO {TILE_TABLE}")
+
+    # Lets orphaned blobs be found when a tile is replaced
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {TILE_TABLE}_hash ON {TILE_TABLE} (hash)")
+
+    # The old per-tile blobs are now free pages, give them back to the disk
+    return True
+
+
+def _migrate_add_coverage_radius(conn: sqlite3.Connection):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({STATUS_TABLE})")]
+    if "coverageRadius" not in columns:
+        conn.execute(
+            f"ALTER TABLE {STATUS_TABLE} ADD COLUMN coverageRadius REAL DEFAULT 0.0"
+        )
+
+
+def _migrate_add_download_frontier(conn: sqlite3.Connection):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {PLAN_TABLE} (
+            z INTEGER PRIMARY KEY,
+            xMin INTEGER,
+            yMin INTEGER,
+            xMax INTEGER,
+            yMax INTEGER,
+            bitmap BLOB
+        )
+    """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {FAILED_TILE_TABLE} (
+            z INTEGER,
+            x INTEGER,
+            y INTEGER,
+            retries INTEGER,
+            PRIMARY KEY (z, x, y)
+        ) WITHOUT ROWID
+    """
+    )
+
+
+def _migrate_add_areas(conn: sqlite3.Connection):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {AREA_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            type TEXT,
+            points TEXT,
+            radiusMiles REAL,
+            complete INTEGER DEFAULT 0
+        )
+    """
+    )
+
+
+# Index i upgrades a database from user_version i to i + 1, migrations
+# return True when the file should be vacuumed afterwards
+_MIGRATIONS = [
+    _migrate_add_tile_hash,
+    _migrate_content_addressed_blobs,
+    _migrate_add_coverage_radius,
+    _migrate_add_download_frontier,
+    _migrate_add_areas,
+]
+
+
+def _setup_database(conn: sqlite3.Connection):
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TILE_TABLE} (
+            z INTEGER,
+            x INTEGER,
+            y INTEGER,
+            data BLOB,
+            PRIMARY KEY (z, x, y)
+        )
+    """
+    )
+
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {STATUS_TABLE} (
+            currentStatus INTEGER,
+            lat REAL,
+            lon REAL,
+            downloadStatus REAL
+        )
+    """
+    )
+
+    cursor.execute(f"SELECT COUNT(*) FROM {STATUS_TABLE}")
+    count = cursor.fetchone()[0]
+    if count == 0:
+        cursor.execute(
+            f"""
+            INSERT OR REPLACE INTO {STATUS_TABLE}
+            (currentStatus, lat, lon, downloadStatus) VALUES (?, ?, ?, ?)
+        """,
+            (0, 0.0, 0.0, 0.0),
+        )
+
+    conn.commit()
+
+    needs_vacuum = False
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for next_version, migration in enumerate(_MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Migrating map database to version {next_version}")
+        needs_vacuum |= bool(migration(conn))
+        cursor.execute(f"PRAGMA user_version={next_version}")
+        conn.commit()
+
+    if needs_vacuum:
+        logger.info("Vacuuming map database after migration")
+        cursor.execute("VACUUM")
+
+
+# Shared by every MapStore in the process, schema is set up on first use
+_connection_pool = SQLiteConnectionPool(
+    MAP_DB_NAME, pragmas=MAP_DB_PRAGMAS, setup=_setup_database
+)
+_tile_cache = TileCache(max_bytes=MAP_TILE_CACHE_BYTES)
 
 
 class MapStore:
@@ -10,128 +206,258 @@ class MapStore:
         if not os.path.exists(MAP_DB_NAME) and not create_if_no_exists:
             raise ValueError("No offline maps found")
 
-        self.__tile_table = "tiles"
-        self.__status_table = "status"
-
-        self.__setup_database()
-
-    def __setup_database(self):
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS {self.__tile_table} (
-                    z INTEGER,
-                    x INTEGER,
-                    y INTEGER,
-                    data BLOB,
-                    PRIMARY KEY (z, x, y)
-                )
-            """
-            )
+        self.__pool = _connection_pool
+        self.__tile_cache = _tile_cache
 
-            cursor.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS {self.__status_table} (
-                    currentStatus INTEGER,
-                    lat REAL,
-                    lon REAL,
-                    downloadStatus REAL
-                )
-            """
-            )
+    def delete_cache(self):
+        self.__pool.delete()
+        self.__tile_cache.clear()
 
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT COUNT(*) FROM {self.__status_table}")
-            count = cursor.fetchone()[0]
-            if count == 0:
-                cursor.execute(
-                    f"""
-                    INSERT OR REPLACE INTO {self.__status_table} 
-                    (currentStatus, lat, lon, downloadStatus) VALUES (?, ?, ?, ?)
-                """,
-                    (0, 0.0, 0.0, 0.0),
-                )
+    def get_tile_cache_stats(self) -> dict:
+        return self.__tile_cache.stats()
 
-            conn.commit()
+    def get_tile(self, x: int, y: int, z: int) -> CachedTile | None:
+        # (hash, data) in one read, the ETag always matches the bytes served
+        tile = self.__tile_cache.get(z, x, y)
+        if tile is not None:
+            return tile
 
-    def delete_cache(self):
-        os.remove(MAP_DB_NAME)
+        # Taken before the read, store_tiles invalidates after its commit
+        generation = self.__tile_cache.generation
+        cursor = self.__pool.reader().execute(
+            f"SELECT t.hash, b.data FROM {TILE_TABLE} t JOIN {BLOB_TABLE} b ON b.hash = t.hash WHERE t.z=? AND t.x=? AND t.y=?",
+            (z, x, y),
+        )
+        result = cursor.fetchone()
+        if result is None:
+            return None
 
-    def get_tile(self, x: int, y: int, z: int):
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"SELECT data from {self.__tile_table} WHERE z=? AND x=? AND y=?",
-                (z, x, y),
-            )
-            result = cursor.fetchone()
+        tile_hash, tile_data = result
+        self.__tile_cache.put(z, x, y, tile_hash, tile_data, generation=generation)
+        return tile_hash, tile_data
 
-            return result[0] if result is not None and len(result) >= 1 else None
+    def get_tile_hash(self, x: int, y: int, z: int) -> str | None:
+        # Enough to answer a revalidation, the covering index never touches
+        # the blob pages
+        tile = self.__tile_cache.get(z, x, y)
+        if tile is not None:
+            return tile[0]
+
+        result = (
+            self.__pool.reader()
+            .execute(
+                f"SELECT hash FROM {TILE_TABLE} WHERE z=? AND x=? AND y=?", (z, x, y)
+            )
+            .fetchone()
+        )
+        return result[0] if result is not None else None
 
     def get_tile_for_zoom(self, zoom: int) -> set[int, int]:
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT x, y FROM tiles WHERE z=?", (zoom,))
-            existing_tiles = set(cursor.fetchall())
-            return existing_tiles
+        cursor = self.__pool.reader().execute(
+            f"SELECT x, y FROM {TILE_TABLE} WHERE z=?", (zoom,)
+        )
+        existing_tiles = set(cursor.fetchall())
+        return existing_tiles
 
     def store_tile(self, x: int, y: int, z: int, tile_data: bytes):
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"INSERT OR REPLACE INTO {self.__tile_table} (z, x, y, data) VALUES (?, ?, ?, ?)",
-                (z, x, y, tile_data),
-            )
-            conn.commit()
+        self.store_tiles([(z, x, y, tile_data)])
+
+    def __write_tiles(
+        self, conn: sqlite3.Connection, tiles: list[tuple[int, int, int, bytes]]
+    ):
+        rows = [(z, x, y, data, tile_hash(data)) for z, x, y, data in tiles]
+
+        replaced_hashes = set()
+        for z, x, y, _, new_hash in rows:
+            result = conn.execute(
+                f"SELECT hash FROM {TILE_TABLE} WHERE z=? AND x=? AND y=?",
+                (z, x, y),
+            ).fetchone()
+            if result is not None and result[0] != new_hash:
+                replaced_hashes.add(result[0])
+
+        # Identical tiles (ocean, forest, ...) share a single blob row
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {BLOB_TABLE} (hash, data) VALUES (?, ?)",
+            [(new_hash, data) for _, _, _, data, new_hash in rows],
+        )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {TILE_TABLE} (z, x, y, hash) VALUES (?, ?, ?, ?)",
+            [(z, x, y, new_hash) for z, x, y, _, new_hash in rows],
+        )
+        conn.executemany(
+            f"""
+            DELETE FROM {BLOB_TABLE} WHERE hash=?
+            AND NOT EXISTS (SELECT 1 FROM {TILE_TABLE} WHERE hash=?)
+        """,
+            [(old_hash, old_hash) for old_hash in replaced_hashes],
+        )
+
+    def store_tiles(self, tiles: list[tuple[int, int, int, bytes]]):
+        # tiles are (z, x, y, data), all written in a single transaction
+        with self.__pool.writer() as conn:
+            self.__write_tiles(conn, tiles)
+
+        for z, x, y, _ in tiles:
+            self.__tile_cache.invalidate(z, x, y)
+
+    def import_tiles(self, chunks: Iterable[list[tuple[int, int, int, bytes]]]) -> int:
+        # The whole import is one transaction, a broken file leaves no trace
+        imported = 0
+        with self.__pool.writer() as conn:
+            for chunk in chunks:
+                self.__write_tiles(conn, chunk)
+                imported += len(chunk)
+
+            # Make the next download re-plan from the tiles table, so the
+            # imported tiles are not fetched again
+            conn.execute(f"DELETE FROM {PLAN_TABLE}")
+
+        self.__tile_cache.clear()
+        return imported
+
+    def iter_blobs(self, chunk_size: int) -> Iterator[list[tuple[str, bytes]]]:
+        cursor = self.__pool.reader().execute(f"SELECT hash, data FROM {BLOB_TABLE}")
+        while chunk := cursor.fetchmany(chunk_size):
+            yield chunk
+
+    def iter_tile_hashes(
+        self, chunk_size: int
+    ) -> Iterator[list[tuple[int, int, int, str]]]:
+        cursor = self.__pool.reader().execute(f"SELECT z, x, y, hash FROM {TILE_TABLE}")
+        while chunk := cursor.fetchmany(chunk_size):
+            yield chunk
 
     def update_lat_lon(self, lat: float, lon: float):
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"UPDATE {self.__status_table} SET lat={lat}, lon={lon} WHERE lat=0.0 AND lon=0.0"
+        with self.__pool.writer() as conn:
+            conn.execute(
+                f"UPDATE {STATUS_TABLE} SET lat=?, lon=? WHERE lat=0.0 AND lon=0.0",
+                (lat, lon),
             )
-            conn.commit()
 
-    def update_download_status(self, download_status: float):
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"UPDATE {self.__status_table} SET downloadStatus={download_status} WHERE currentStatus=0"
+    def update_download_status(
+        self, download_status: float, coverage_radius: float | None = None
+    ):
+        with self.__pool.writer() as conn:
+            conn.execute(
+                f"UPDATE {STATUS_TABLE} SET downloadStatus=? WHERE currentStatus=0",
+                (download_status,),
             )
-            conn.commit()
+            if coverage_radius is not None:
+                conn.execute(
+                    f"UPDATE {STATUS_TABLE} SET coverageRadius=? WHERE currentStatus=0",
+                    (coverage_radius,),
+                )
 
     def get_cached_lat_lon(self) -> tuple[float, float] | tuple[None, None]:
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {self.__status_table}")
-            result = cursor.fetchone()
-
-            return (
-                (result[1], result[2])
-                if result is not None and len(result) >= 3
-                else (None, None)
-            )
+        cursor = self.__pool.reader().execute(f"SELECT * FROM {STATUS_TABLE}")
+        result = cursor.fetchone()
+
+        return (
+            (result[1], result[2])
+            if result is not None and len(result) >= 3
+            else (None, None)
+        )
 
     def get_download_status(self) -> float:
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {self.__status_table}")
-            result = cursor.fetchone()
+        cursor = self.__pool.reader().execute(f"SELECT * FROM {STATUS_TABLE}")
+        result = cursor.fetchone()
+
+        return result[3] if result is not None and len(result) >= 4 else 0.0
+
+    def get_coverage_radius(self) -> float:
+        cursor = self.__pool.reader().execute(
+            f"SELECT coverageRadius FROM {STATUS_TABLE}"
+        )
+        result = cursor.fetchone()
+
+        return result[0] if result is not None and result[0] is not None else 0.0
+
+    def get_download_plan(self) -> dict[int, tuple[TileBounds, bytes]]:
+        cursor = self.__pool.reader().execute(
+            f"SELECT z, xMin, yMin, xMax, yMax, bitmap FROM {PLAN_TABLE}"
+        )
+        return {
+            z: ((x_min, y_min, x_max, y_max), bitmap)
+            for z, x_min, y_min, x_max, y_max, bitmap in cursor.fetchall()
+        }
+
+    def get_failed_tiles(self) -> dict[tuple[int, int, int], int]:
+        cursor = self.__pool.reader().execute(
+            f"SELECT z, x, y, retries FROM {FAILED_TILE_TABLE}"
+        )
+        return {(z, x, y): retries for z, x, y, retries in cursor.fetchall()}
 
-            return result[3] if result is not None and len(result) >= 4 else 0.0
+    def save_download_frontier(
+        self,
+        plan: dict[int, tuple[TileBounds, bytes]],
+        failed_tiles: dict[tuple[int, int, int], int],
+        recovered_tiles: list[tuple[int, int, int]],
+    ):
+        with self.__pool.writer() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {PLAN_TABLE} (z, xMin, yMin, xMax, yMax, bitmap) VALUES (?, ?, ?, ?, ?, ?)",
+                [(z, *bounds, bitmap) for z, (bounds, bitmap) in plan.items()],
+            )
+            conn.executemany(
+                f"DELETE FROM {FAILED_TILE_TABLE} WHERE z=? AND x=? AND y=?",
+                recovered_tiles,
+            )
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {FAILED_TILE_TABLE} (z, x, y, retries) VALUES (?, ?, ?, ?)",
+                [(z, x, y, retries) for (z, x, y), retries in failed_tiles.items()],
+            )
+
+    def add_area(
+        self,
+        name: str,
+        area_type: str,
+        points: list[tuple[float, float]],
+        radius_miles: float,
+    ) -> int:
+        with self.__pool.writer() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO {AREA_TABLE} (name, type, points, radiusMiles) VALUES (?, ?, ?, ?)",
+                (name, area_type, json.dumps(points), radius_miles),
+            )
+            # A new area means the cache is no longer complete
+            conn.execute(f"UPDATE {STATUS_TABLE} SET currentStatus=0")
+            return cursor.lastrowid
+
+    def get_areas(self) -> list[dict]:
+        cursor = self.__pool.reader().execute(
+            f"SELECT id, name, type, points, radiusMiles, complete FROM {AREA_TABLE} ORDER BY id"
+        )
+        return [
+            {
+                "id": area_id,
+                "name": name,
+                "type": area_type,
+                "points": [tuple(point) for point in json.loads(points)],
+                "radiusMiles": radius_miles,
+                "complete": complete == 1,
+            }
+            for area_id, name, area_type, points, radius_miles, complete in cursor.fetchall()
+        ]
+
+    def delete_area(self, area_id: int):
+        with self.__pool.writer() as conn:
+            conn.execute(f"DELETE FROM {AREA_TABLE} WHERE id=?", (area_id,))
+
+    def mark_areas_complete(self, area_ids: list[int]):
+        with self.__pool.writer() as conn:
+            conn.executemany(
+                f"UPDATE {AREA_TABLE} SET complete=1 WHERE id=?",
+                [(area_id,) for area_id in area_ids],
+            )
 
     def is_download_complete(self) -> bool:
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {self.__status_table}")
-            result = cursor.fetchone()
-            return result[0] == 1 if result is not None and len(result) >= 1 else False
+        cursor = self.__pool.reader().execute(f"SELECT * FROM {STATUS_TABLE}")
+        result = cursor.fetchone()
+        return result[0] == 1 if result is not None and len(result) >= 1 else False
 
     def mark_download_complete(self):
-        with sqlite3.connect(MAP_DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"UPDATE {self.__status_table} SET currentStatus=1 WHERE currentStatus=0"
+        with self.__pool.writer() as conn:
+            conn.execute(
+                f"UPDATE {STATUS_TABLE} SET currentStatus=1 WHERE currentStatus=0"
             )
-            conn.commit()
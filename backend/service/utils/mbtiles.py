@@ -0,0 +1,163 @@
+from typing import Iterator
+import argparse
+import logging
+import sqlite3
+import os
+
+from service.utils.map_store import MapStore
+from service.utils.constants import MBTILES_CHUNK_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# The MBTiles deduplicated layout mirrors the map store: every distinct image
+# is stored once and the tiles view joins it back to its coordinates
+MBTILES_SCHEMA = """
+    CREATE TABLE metadata (name TEXT, value TEXT);
+    CREATE UNIQUE INDEX name ON metadata (name);
+    CREATE TABLE images (tile_id TEXT, tile_data BLOB);
+    CREATE UNIQUE INDEX images_id ON images (tile_id);
+    CREATE TABLE map (
+        zoom_level INTEGER,
+        tile_column INTEGER,
+        tile_row INTEGER,
+        tile_id TEXT
+    );
+    CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row);
+    CREATE VIEW tiles AS
+        SELECT
+            map.zoom_level AS zoom_level,
+            map.tile_column AS tile_column,
+            map.tile_row AS tile_row,
+            images.tile_data AS tile_data
+        FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+
+def flip_row(z: int, row: int) -> int:
+    # MBTiles rows are TMS (origin bottom left), the map store uses XYZ
+    return (1 << z) - 1 - row
+
+
+def export_mbtiles(map_store: MapStore, path: str, name: str = "offline_map") -> int:
+    if os.path.exists(path):
+        raise FileExistsError(f"'{path}' already exists")
+
+    exported = 0
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.executescript(MBTILES_SCHEMA)
+            for blobs in map_store.iter_blobs(MBTILES_CHUNK_SIZE):
+                conn.executemany(
+                    "INSERT INTO images (tile_id, tile_data) VALUES (?, ?)", blobs
+                )
+            for tiles in map_store.iter_tile_hashes(MBTILES_CHUNK_SIZE):
+                conn.executemany(
+                    "INSERT INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                    [(z, x, flip_row(z, y), tile_id) for z, x, y, tile_id in tiles],
+                )
+                exported += len(tiles)
+
+            min_zoom, max_zoom = conn.execute(
+                "SELECT MIN(zoom_level), MAX(zoom_level) FROM map"
+            ).fetchone()
+            metadata = {
+                "name": name,
+                "format": "png",
+                "type": "baselayer",
+                "version": "1.0",
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+            }
+            conn.executemany(
+                "INSERT INTO metadata (name, value) VALUES (?, ?)",
+                [
+                    (key, str(value))
+                    for key, value in metadata.items()
+                    if value is not None
+                ],
+            )
+    except Exception:
+        conn.close()
+        os.remove(path)
+        raise
+    conn.close()
+
+    logger.info(f"Exported {exported} tiles to '{path}'")
+    return exported
+
+
+def _read_tiles(
+    conn: sqlite3.Connection,
+) -> Iterator[list[tuple[int, int, int, bytes]]]:
+    # Works for both the flat and the deduplicated layout, both expose tiles
+    cursor = conn.execute(
+        "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"
+    )
+    while chunk := cursor.fetchmany(MBTILES_CHUNK_SIZE):
+        yield [(z, x, flip_row(z, row), data) for z, x, row, data in chunk]
+
+
+def _check_package(conn: sqlite3.Connection):
+    tile_format = conn.execute(
+        "SELECT value FROM metadata WHERE name='format'"
+    ).fetchone()
+    if tile_format is not None and tile_format[0] != "png":
+        raise ValueError(f"Unsupported tile format '{tile_format[0]}'")
+    # Fails on a file without a usable tiles table or view
+    conn.execute(
+        "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles LIMIT 1"
+    ).fetchone()
+
+
+def _open_package(path: str) -> sqlite3.Connection:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"'{path}' does not exist")
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def validate_mbtiles(path: str):
+    # Cheap checks before anything is touched, raises ValueError like import
+    conn = _open_package(path)
+    try:
+        _check_package(conn)
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"'{path}' is not a valid MBTiles file: {e}") from e
+    finally:
+        conn.close()
+
+
+def import_mbtiles(map_store: MapStore, path: str) -> int:
+    conn = _open_package(path)
+    try:
+        _check_package(conn)
+        # Tiles are streamed chunk by chunk into a single map store transaction
+        imported = map_store.import_tiles(_read_tiles(conn))
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"'{path}' is not a valid MBTiles file: {e}") from e
+    finally:
+        conn.close()
+
+    logger.info(f"Imported {imported} tiles from '{path}'")
+    return imported
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Import or export the offline map store as MBTiles"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Merge an MBTiles file")
+    import_parser.add_argument("path")
+    export_parser = subparsers.add_parser("export", help="Write an MBTiles file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--name", default="offline_map")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_mbtiles(MapStore(create_if_no_exists=True), args.path)
+    else:
+        export_mbtiles(MapStore(), args.path, name=args.name)
@@ -0,0 +1,122 @@
+from typing import Awaitable, Callable, Optional
+import logging
+import asyncio
+import time
+
+from service.utils.parsing_utils import estimate_tokens
+from service.utils.memory_queue import DurableMemoryQueue, MessageKind, QueuedMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBatcher:
+    def __init__(
+        self,
+        queue: DurableMemoryQueue,
+        handle_batch: Callable[[MessageKind, list[str]], Awaitable[None]],
+        window: float,
+        max_batch_size: int,
+        max_batch_tokens: int,
+        max_concurrency: int,
+    ):
+        self.__queue = queue
+        self.__handle_batch = handle_batch
+        self.__window = window
+        self.__max_batch_size = max_batch_size
+        self.__max_batch_tokens = max_batch_tokens
+        self.__semaphore = asyncio.Semaphore(max_concurrency)
+
+        # A message that did not fit the previous batch opens the next one
+        self.__carry: Optional[QueuedMessage] = None
+        self.__in_flight: set[asyncio.Task] = set()
+
+        self.__batches = 0
+        self.__messages = 0
+        self.__max_seen_batch_size = 0
+        self.__max_seen_queue_depth = 0
+
+    async def __next_message(
+        self, timeout: Optional[float] = None
+    ) -> Optional[QueuedMessage]:
+        if self.__carry is not None:
+            queued, self.__carry = self.__carry, None
+            return queued
+        return await self.__queue.get(timeout)
+
+    async def __collect_batch(self) -> list[QueuedMessage]:
+        batch = [await self.__next_message()]
+        kind = batch[0][1]
+        # A voice message is an audio file the extraction deletes, and needs
+        # its own model call anyway. Batched, a failure on the k-th file
+        # would replay the batch against files already gone
+        if kind == MessageKind.VOICE:
+            return batch
+        tokens = estimate_tokens(batch[0][2])
+
+        # Quick follow-up messages share a single extraction call
+        deadline = time.monotonic() + self.__window
+        while len(batch) < self.__max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            queued = await self.__next_message(remaining)
+            if queued is None:
+                break
+
+            # Text and voice messages go to different agents
+            message_tokens = estimate_tokens(queued[2])
+            if queued[1] != kind or tokens + message_tokens > self.__max_batch_tokens:
+                self.__carry = queued
+                break
+            batch.append(queued)
+            tokens += message_tokens
+        return batch
+
+    async def __process(self, batch: list[QueuedMessage]):
+        try:
+            await self.__handle_batch(batch[0][1], [message for *_, message in batch])
+            await self.__queue.ack([entry_id for entry_id, *_ in batch])
+        except Exception as e:
+            # Left unacknowledged, the batch is retried once it is reclaimed
+            logger.error(f"Failed to extract memories from batch: {e}")
+        finally:
+            self.__semaphore.release()
+
+    async def run(self):
+        while True:
+            # Wait for a free worker first, so messages keep coalescing in
+            # the queue while every extraction slot is busy
+            await self.__semaphore.acquire()
+            try:
+                batch = await self.__collect_batch()
+            except BaseException:
+                self.__semaphore.release()
+                raise
+
+            self.__batches += 1
+            self.__messages += len(batch)
+            self.__max_seen_batch_size = max(self.__max_seen_batch_size, len(batch))
+            queue_depth = await self.__queue.size()
+            self.__max_seen_queue_depth = max(self.__max_seen_queue_depth, queue_depth)
+            logger.info(
+                f"Extracting memories from a batch of {len(batch)} messages, {queue_depth} queued or in flight"
+            )
+
+            task = asyncio.create_task(self.__process(batch))
+            self.__in_flight.add(task)
+            task.add_done_callback(self.__in_flight.discard)
+
+    async def stats(self) -> dict:
+        return {
+            **self.__queue.stats(),
+            "batches": self.__batches,
+            "messages": self.__messages,
+            "averageBatchSize": (
+                round(self.__messages / self.__batches, 2) if self.__batches else 0
+            ),
+            "maxBatchSize": self.__max_seen_batch_size,
+            "queueDepth": await self.__queue.size(),
+            "maxQueueDepth": self.__max_seen_queue_depth,
+            "inFlightBatches": len(self.__in_flight),
+        }
@@ -0,0 +1,86 @@
+from langgraph.store.base import Item
+import logging
+
+from service.utils.memory_store import MemoryStore
+from service.utils.redis_store import SharedRedisStore
+from service.utils.constants import (
+    MEMORY_COMPACTED_KEY,
+    MEMORY_COMPACT_MAX_FIELDS,
+    MEMORY_HISTORY_MAX_ENTRIES,
+    MEMORY_SCAN_COUNT,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCompactor:
+    def __init__(self, user_id: str = "1"):
+        self.__namespace = ("memories", user_id)
+
+    def __list_items(self) -> list[Item]:
+        store = SharedRedisStore().get_store()
+        items = []
+        while True:
+            page = store.search(
+                self.__namespace, limit=MEMORY_SCAN_COUNT, offset=len(items)
+            )
+            items.extend(page)
+            if len(page) < MEMORY_SCAN_COUNT:
+                break
+        return sorted(items, key=lambda item: item.created_at)
+
+    def compact(self) -> dict:
+        items = self.__list_items()
+        if len(items) <= 1:
+            return {"memories": len(items), "removed": 0, "fields": 0}
+
+        # Replay the memories in order, a later value for a field wins and
+        # the one it replaces goes to the history
+        fields: dict[str, tuple] = {}
+        superseded: list[tuple[str, object, str]] = []
+        for item in items:
+            for field, value in item.value.items():
+                previous = fields.get(field)
+                if previous is not None and previous[0] != value:
+                    superseded.append((field, previous[0], item.created_at))
+                fields[field] = (value, item.created_at)
+
+        # Bound the block attached to every prompt, the least recently
+        # updated fields only live on in the history
+        latest = sorted(fields.items(), key=lambda entry: entry[1][1], reverse=True)
+        for field, (value, _) in latest[MEMORY_COMPACT_MAX_FIELDS:]:
+            superseded.append((field, value, items[-1].created_at))
+        compacted = {
+            field: value for field, (value, _) in latest[:MEMORY_COMPACT_MAX_FIELDS]
+        }
+
+        memory_store = MemoryStore()
+        memory_store.append_memory_history(
+            [
+                (field, value, superseded_at.isoformat())
+                for field, value, superseded_at in superseded
+            ],
+            MEMORY_HISTORY_MAX_ENTRIES,
+        )
+
+        # Write the merged memory before deleting anything, a crash in
+        # between leaves duplicates behind, never a lost memory
+        store = SharedRedisStore().get_store()
+        store.put(self.__namespace, MEMORY_COMPACTED_KEY, compacted)
+        # Dated like the newest memory it merges, a memory extracted while
+        # compacting is newer and must still win over the merged values
+        memory_store.set_memory_created_at(
+            self.__namespace, MEMORY_COMPACTED_KEY, items[-1].created_at
+        )
+        removed = 0
+        for item in items:
+            if item.key != MEMORY_COMPACTED_KEY:
+                store.delete(self.__namespace, item.key)
+                removed += 1
+        memory_store.invalidate_snapshot()
+
+        logger.info(
+            f"Compacted {len(items)} memories into {len(compacted)} fields, {len(superseded)} values moved to history"
+        )
+        return {"memories": len(items), "removed": removed, "fields": len(compacted)}
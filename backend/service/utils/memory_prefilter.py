@@ -0,0 +1,187 @@
+from enum import Enum
+import threading
+import re
+
+
+class PrefilterDecision(Enum):
+    # Small talk only, the memory LLM is not called
+    SKIP = "skip"
+    # Only structured facts the rules are sure about, stored as they are
+    STORE = "store"
+    # Something the rules cannot structure, the memory LLM extracts it
+    EXTRACT = "extract"
+
+
+PHONE_PATTERN = re.compile(
+    r"(?<!\w)(?:\+?\d{1,3}[\s.-]?)?(?:\(\d{3}\)|\d{3})?[\s.-]?\d{3}[\s.-]\d{4}(?!\w)"
+)
+EMAIL_PATTERN = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+ADDRESS_PATTERN = re.compile(
+    r"\b\d+\s+(?:[a-z]+\s+){1,3}(?:st|street|ave|avenue|rd|road|blvd|boulevard|dr|drive|ln|lane|ct|court|way|pl|place|hwy|highway)\b",
+    re.IGNORECASE,
+)
+COUNT_PATTERN = re.compile(
+    r"\b(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten)\s+(?:\w+\s+)?(?:kids?|children|child|babies|baby|people|adults?|persons?|pets?|dogs?|cats?|family members)\b",
+    re.IGNORECASE,
+)
+# Only a message made entirely of these is skipped, anything else may hold a
+# fact and goes to the LLM
+CHITCHAT_PATTERN = re.compile(
+    r"^\W*(?:(?:hi|hello|hey|thanks|thank you|thank u|thx|ty|ok|okay|k|sure|yes|yeah|yep|no|nope|cool|great|nice|got it|good (?:morning|afternoon|evening|night)|bye|goodbye|alright|fine)\W*)+$",
+    re.IGNORECASE,
+)
+# Case sensitive on purpose, a capitalized word is most likely a name or place
+SELF_INTRODUCTION_PATTERN = re.compile(r"\b(?i:i'?m|i am)\s+[A-Z][a-z]+")
+PLACE_PATTERN = re.compile(r"\b(?i:in|at|near|from)\s+[A-Z][a-z]+")
+
+# Gazetteers per memory category, a hit means there is more than a contact to
+# extract
+VOCABULARY = {
+    "name": [r"my name is", r"call me", r"i am called", r"this is \w+ speaking"],
+    "location": [
+        r"i live",
+        r"we live",
+        r"i'?m at",
+        r"i am at",
+        r"we'?re at",
+        r"we are at",
+        r"located",
+        r"address",
+        r"near",
+        r"shelter",
+        r"neighbou?rhood",
+        r"apartment",
+        r"zip",
+    ],
+    "status": [
+        r"injur\w*",
+        r"hurt",
+        r"bleed\w*",
+        r"broken",
+        r"fractur\w*",
+        r"burn\w*",
+        r"unconscious",
+        r"sick",
+        r"pain",
+        r"trapped",
+        r"stuck",
+        r"safe",
+        r"flood\w*",
+        r"damag\w*",
+        r"collaps\w*",
+        r"fire",
+        r"smoke",
+        r"gas leak",
+        r"power (?:is )?out",
+        r"no (?:power|electricity|water|heat|signal)",
+        r"evacuat\w*",
+        r"pregnan\w*",
+        r"diabet\w*",
+        r"asthma\w*",
+        r"allerg\w*",
+        r"disabilit\w*",
+        r"wheelchair",
+        r"help",
+        r"sos",
+        r"emergency",
+        r"911",
+        r"danger\w*",
+        r"dying",
+        r"scared",
+        r"can'?t breathe",
+        r"not breathing",
+        r"drown\w*",
+    ],
+    "needs": [
+        r"need\w*",
+        r"require\w*",
+        r"running (?:low|out)",
+        r"out of",
+        r"rescue",
+        r"medic\w*",
+        r"doctor",
+        r"ambulance",
+        r"insulin",
+        r"inhaler",
+        r"oxygen",
+        r"food",
+        r"water",
+        r"blankets?",
+        r"generator",
+        r"supplies",
+        r"formula",
+        r"diapers?",
+    ],
+    "dependents": [
+        r"kids?",
+        r"child\w*",
+        r"bab(?:y|ies)",
+        r"son",
+        r"daughter",
+        r"wife",
+        r"husband",
+        r"partner",
+        r"mother",
+        r"father",
+        r"mom",
+        r"dad",
+        r"parents?",
+        r"grand\w+",
+        r"elderly",
+        r"pets?",
+        r"dogs?",
+        r"cats?",
+        r"(?:\d+|two|three|four|five|six|seven|eight|nine|ten) of us",
+    ],
+}
+VOCABULARY_PATTERNS = {
+    category: re.compile(rf"\b(?:{'|'.join(words)})\b", re.IGNORECASE)
+    for category, words in VOCABULARY.items()
+}
+
+
+class MemoryPrefilter:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counts = {decision: 0 for decision in PrefilterDecision}
+
+    def classify(self, message: str) -> tuple[PrefilterDecision, dict]:
+        contacts = PHONE_PATTERN.findall(message) + EMAIL_PATTERN.findall(message)
+        categories = [
+            category
+            for category, pattern in VOCABULARY_PATTERNS.items()
+            if pattern.search(message)
+        ]
+        if SELF_INTRODUCTION_PATTERN.search(message):
+            categories.append("name")
+        if ADDRESS_PATTERN.search(message) or PLACE_PATTERN.search(message):
+            categories.append("location")
+        if COUNT_PATTERN.search(message):
+            categories.append("dependents")
+
+        if CHITCHAT_PATTERN.match(message):
+            decision, facts = PrefilterDecision.SKIP, {}
+        elif contacts and not categories:
+            facts = {"contact": ", ".join(contact.strip() for contact in contacts)}
+            decision = PrefilterDecision.STORE
+        else:
+            # Misses in the gazetteers cost an LLM call, never a lost fact
+            decision, facts = PrefilterDecision.EXTRACT, {}
+
+        with self.__lock:
+            self.__counts[decision] += 1
+        return decision, facts
+
+    def stats(self) -> dict:
+        with self.__lock:
+            total = sum(self.__counts.values())
+            skipped = self.__counts[PrefilterDecision.SKIP]
+            stored = self.__counts[PrefilterDecision.STORE]
+            return {
+                "messages": total,
+                "skipped": skipped,
+                "storedDirectly": stored,
+                "extracted": self.__counts[PrefilterDecision.EXTRACT],
+                # Every message that never reached the LLM
+                "skipRate": round((skipped + stored) / total, 3) if total else 0,
+            }
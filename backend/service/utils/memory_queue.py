@@ -0,0 +1,258 @@
+from collections import deque
+from enum import Enum
+from typing import Optional
+import logging
+import asyncio
+import socket
+import redis.asyncio as redis
+from redis.exceptions import RedisError, ResponseError
+
+from service.utils.environment import REDIS_HOST
+
+
+logger = logging.getLogger(__name__)
+
+MEMORY_QUEUE_STREAM = "memory:queue"
+MEMORY_QUEUE_GROUP = "memory-extractors"
+MEMORY_DEAD_LETTER_STREAM = "memory:dead-letter"
+
+
+class MessageKind(Enum):
+    TEXT = "text"
+    # The message is the path of a recorded wav file
+    VOICE = "voice"
+
+
+# (stream entry id, kind, user message)
+QueuedMessage = tuple[str, MessageKind, str]
+
+
+def _to_queued(entry_id: str, fields: dict) -> QueuedMessage:
+    # Entries queued before kinds were recorded are all text
+    kind = MessageKind(fields.get("kind", MessageKind.TEXT.value))
+    return entry_id, kind, fields["message"]
+
+
+class OverflowPolicy(Enum):
+    # The oldest queued messages are trimmed to make room
+    DROP_OLDEST = "drop-oldest"
+    # New messages are refused until the extractors catch up
+    REJECT = "reject"
+
+
+class DurableMemoryQueue:
+    # Redis Streams consumer group: a message stays in the stream until its
+    # extraction is acknowledged, so a restart replays what was in flight
+    def __init__(
+        self,
+        max_length: int,
+        overflow_policy: OverflowPolicy,
+        claim_idle: float,
+        block: float,
+        max_deliveries: int,
+        consumer: Optional[str] = None,
+    ):
+        self.__client = redis.Redis.from_url(REDIS_HOST, decode_responses=True)
+        self.__max_length = max_length
+        self.__overflow_policy = overflow_policy
+        self.__claim_idle_ms = int(claim_idle * 1000)
+        self.__block = block
+        self.__max_deliveries = max_deliveries
+        # Stable across restarts, so a process finds its own pending entries
+        self.__consumer = consumer or socket.gethostname()
+
+        self.__group_ready = False
+        # Pending entries are replayed first, starting after this id
+        self.__replay_cursor: Optional[str] = "0"
+        # Entries taken over by reclaim(), served before new messages
+        self.__reclaimed_entries: deque[QueuedMessage] = deque()
+
+        self.__enqueued = 0
+        self.__shed = 0
+        self.__rejected = 0
+        self.__replayed = 0
+        self.__reclaimed = 0
+        self.__dead_lettered = 0
+
+    async def __ensure_group(self):
+        if self.__group_ready:
+            return
+
+        try:
+            await self.__client.xgroup_create(
+                MEMORY_QUEUE_STREAM, MEMORY_QUEUE_GROUP, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        self.__group_ready = True
+
+    async def __dead_letter(self, entry_id: str, deliveries: int):
+        entries = await self.__client.xrange(
+            MEMORY_QUEUE_STREAM, min=entry_id, max=entry_id
+        )
+        if entries:
+            # Voice files of dead letters are kept, for inspection
+            await self.__client.xadd(
+                MEMORY_DEAD_LETTER_STREAM,
+                {**entries[0][1], "id": entry_id, "deliveries": deliveries},
+                maxlen=self.__max_length,
+                approximate=False,
+            )
+        await self.ack([entry_id])
+        self.__dead_lettered += 1
+        logger.error(
+            f"Memory queue entry {entry_id} failed {deliveries} times, moved to {MEMORY_DEAD_LETTER_STREAM}"
+        )
+
+    async def reclaim(self):
+        # Entries of crashed consumers and failed extractions stay pending,
+        # the ones idle for too long are retried or given up on
+        try:
+            await self.__ensure_group()
+            stale = await self.__client.xpending_range(
+                MEMORY_QUEUE_STREAM,
+                MEMORY_QUEUE_GROUP,
+                min="-",
+                max="+",
+                count=self.__max_length,
+                idle=self.__claim_idle_ms,
+            )
+            for entry in stale:
+                if entry["times_delivered"] >= self.__max_deliveries:
+                    await self.__dead_letter(
+                        entry["message_id"], entry["times_delivered"]
+                    )
+
+            _, claimed, _ = await self.__client.xautoclaim(
+                MEMORY_QUEUE_STREAM,
+                MEMORY_QUEUE_GROUP,
+                self.__consumer,
+                min_idle_time=self.__claim_idle_ms,
+                start_id="0-0",
+                count=self.__max_length,
+            )
+            for entry_id, fields in claimed:
+                if not fields:
+                    # Trimmed by the overflow policy while pending
+                    await self.ack([entry_id])
+                    continue
+                self.__reclaimed_entries.append(_to_queued(entry_id, fields))
+            self.__reclaimed += len(claimed)
+        except RedisError as e:
+            logger.error(f"Failed to reclaim memory queue entries: {e}")
+
+    async def run_reclaimer(self, interval: float):
+        # Sleeps first, this consumer's own pending entries are replayed on
+        # start and must not be claimed a second time
+        while True:
+            await asyncio.sleep(interval)
+            await self.reclaim()
+
+    async def put(self, message: str, kind: MessageKind) -> bool:
+        # Never raises, chat responses must not fail on memory ingestion
+        try:
+            await self.__ensure_group()
+            length = await self.__client.xlen(MEMORY_QUEUE_STREAM)
+            if length >= self.__max_length:
+                if self.__overflow_policy == OverflowPolicy.REJECT:
+                    self.__rejected += 1
+                    logger.error("Memory queue is full, message rejected")
+                    return False
+                self.__shed += length - self.__max_length + 1
+                logger.error("Memory queue is full, dropping the oldest message")
+
+            await self.__client.xadd(
+                MEMORY_QUEUE_STREAM,
+                {"message": message, "kind": kind.value},
+                maxlen=self.__max_length,
+                approximate=False,
+            )
+            self.__enqueued += 1
+            return True
+        except RedisError as e:
+            logger.error(f"Failed to queue message for memory extraction: {e}")
+            return False
+
+    async def __read(self, stream_id: str, block: Optional[int]) -> list:
+        response = await self.__client.xreadgroup(
+            MEMORY_QUEUE_GROUP,
+            self.__consumer,
+            {MEMORY_QUEUE_STREAM: stream_id},
+            count=1,
+            block=block,
+        )
+        return response[0][1] if response else []
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[QueuedMessage]:
+        # Returns None once timeout passes without a message
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            try:
+                await self.__ensure_group()
+
+                if self.__reclaimed_entries:
+                    return self.__reclaimed_entries.popleft()
+
+                while self.__replay_cursor is not None:
+                    entries = await self.__read(self.__replay_cursor, block=None)
+                    if not entries:
+                        self.__replay_cursor = None
+                        break
+                    entry_id, fields = entries[0]
+                    self.__replay_cursor = entry_id
+                    if not fields:
+                        # Trimmed by the overflow policy while pending
+                        await self.ack([entry_id])
+                        continue
+                    self.__replayed += 1
+                    logger.info(f"Replaying queued memory message {entry_id}")
+                    return _to_queued(entry_id, fields)
+
+                block = self.__block
+                if deadline is not None:
+                    block = min(block, deadline - loop.time())
+                if block > 0:
+                    entries = await self.__read(">", block=max(int(block * 1000), 1))
+                    if entries:
+                        return _to_queued(*entries[0])
+            except RedisError as e:
+                logger.error(f"Failed to read the memory queue: {e}")
+                self.__group_ready = False
+                await asyncio.sleep(1)
+
+            if deadline is not None and loop.time() >= deadline:
+                return None
+
+    async def ack(self, entry_ids: list[str]):
+        try:
+            async with self.__client.pipeline(transaction=False) as pipeline:
+                pipeline.xack(MEMORY_QUEUE_STREAM, MEMORY_QUEUE_GROUP, *entry_ids)
+                pipeline.xdel(MEMORY_QUEUE_STREAM, *entry_ids)
+                await pipeline.execute()
+        except RedisError as e:
+            # Unacknowledged entries are replayed, at worst extracted twice
+            logger.error(f"Failed to acknowledge memory queue entries: {e}")
+
+    async def size(self) -> int:
+        # Queued and in-flight messages, acknowledged ones are deleted
+        try:
+            return await self.__client.xlen(MEMORY_QUEUE_STREAM)
+        except RedisError:
+            return -1
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.__enqueued,
+            "replayed": self.__replayed,
+            "reclaimed": self.__reclaimed,
+            "deadLettered": self.__dead_lettered,
+            "shed": self.__shed,
+            "rejected": self.__rejected,
+            "overflowPolicy": self.__overflow_policy.value,
+        }
+
+    async def close(self):
+        await self.__client.aclose()
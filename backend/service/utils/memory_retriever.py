@@ -0,0 +1,140 @@
+from collections import Counter
+import threading
+import math
+import re
+
+from service.utils.memory_store import MemoryStore
+from service.utils.parsing_utils import estimate_tokens
+from service.utils.constants import (
+    MEMORY_RETRIEVAL_TOP_K,
+    MEMORY_RETRIEVAL_TOKEN_BUDGET,
+    MEMORY_RETRIEVAL_CACHE_SIZE,
+)
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for",
+    "from", "has", "have", "how", "i", "in", "is", "it", "me", "my", "of", "on",
+    "or", "our", "so", "that", "the", "there", "this", "to", "us", "was", "we",
+    "what", "when", "where", "which", "who", "will", "with", "you", "your",
+}  # fmt: skip
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Crude plural folding, "blankets" should find "blanket"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, documents: list[list[str]], k1: float = 1.5, b: float = 0.75):
+        self.__k1 = k1
+        self.__b = b
+        self.__term_frequencies = [Counter(document) for document in documents]
+        self.__lengths = [len(document) for document in documents]
+        self.__average_length = sum(self.__lengths) / len(documents) if documents else 0
+
+        document_frequencies = Counter(
+            term for document in documents for term in set(document)
+        )
+        total = len(documents)
+        self.__idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequencies.items()
+        }
+
+    def scores(self, query: list[str]) -> list[float]:
+        scores = []
+        for frequencies, length in zip(self.__term_frequencies, self.__lengths):
+            norm = self.__k1 * (
+                1 - self.__b + self.__b * length / (self.__average_length or 1)
+            )
+            score = 0.0
+            for term in query:
+                frequency = frequencies.get(term)
+                if frequency:
+                    score += (
+                        self.__idf[term]
+                        * frequency
+                        * (self.__k1 + 1)
+                        / (frequency + norm)
+                    )
+            scores.append(score)
+        return scores
+
+
+class MemoryRetriever:
+    def __init__(self):
+        # Tokenized facts are reused across turns, memories rarely change
+        self.__lock = threading.Lock()
+        self.__tokens: dict[str, list[str]] = {}
+        self.__indexed_facts: list[str] = []
+        self.__index = BM25Index([])
+
+    def __tokenize_fact(self, fact: str) -> list[str]:
+        with self.__lock:
+            tokens = self.__tokens.get(fact)
+            if tokens is None:
+                if len(self.__tokens) >= MEMORY_RETRIEVAL_CACHE_SIZE:
+                    self.__tokens.clear()
+                tokens = self.__tokens[fact] = tokenize(fact)
+            return tokens
+
+    def __get_index(self, facts: list[str]) -> BM25Index:
+        # The same memories are queried turn after turn, index them once
+        with self.__lock:
+            if facts == self.__indexed_facts:
+                return self.__index
+
+        index = BM25Index([self.__tokenize_fact(fact) for fact in facts])
+        with self.__lock:
+            self.__indexed_facts, self.__index = facts, index
+        return index
+
+    def select(
+        self,
+        facts: list[str],
+        query: str,
+        top_k: int = MEMORY_RETRIEVAL_TOP_K,
+        token_budget: int = MEMORY_RETRIEVAL_TOKEN_BUDGET,
+    ) -> list[str]:
+        # facts are in chronological order, so are the selected ones
+        scores = self.__get_index(facts).scores(tokenize(query))
+
+        # Relevant facts first, then the most recent ones fill what is left
+        # of the budget, so the agent never loses the latest context
+        ranked = sorted(
+            range(len(facts)),
+            key=lambda i: (scores[i] > 0, scores[i], i),
+            reverse=True,
+        )
+
+        selected = []
+        used_tokens = 0
+        for i in ranked:
+            if len(selected) >= top_k:
+                break
+            tokens = estimate_tokens(facts[i])
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append(i)
+            used_tokens += tokens
+        return [facts[i] for i in sorted(selected)]
+
+
+_retriever = MemoryRetriever()
+
+
+def build_memory_context(query: str) -> str:
+    facts = []
+    for memory in MemoryStore().list_memory():
+        for key, val in memory[0].items():
+            facts.append(f"{key}: {val}")
+    return "\n".join(_retriever.select(facts, query))
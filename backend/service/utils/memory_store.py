@@ -1,28 +1,191 @@
+from datetime import datetime
+from typing import Optional
+import threading
+import logging
 import redis
+import re
+from redis.commands.search.query import Query
 
 from service.utils.singleton import singleton
 from service.utils.environment import REDIS_HOST
+from service.utils.constants import MEMORY_SCAN_COUNT, MEMORY_FETCH_BATCH_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# store:* is the key format for memory store
+# All other keys are langfuse keys
+MEMORY_KEY_PATTERN = "store:*"
+# Bumped on every memory change, published so other workers drop their copy
+MEMORY_VERSION_KEY = "memory:version"
+MEMORY_CHANGES_CHANNEL = "memory:changes"
+# Values replaced by memory compaction, never attached to prompts
+MEMORY_HISTORY_KEY = "memory:history"
+# Search index langgraph's RedisStore keeps over store:*
+MEMORY_INDEX = "store"
+TAG_SPECIAL_PATTERN = re.compile(r"[,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\ ]")
 
 
 @singleton
 class MemoryStore:
     def __init__(self):
-        redis_host, redis_port = REDIS_HOST.split("redis://")[1].split(":")
-        self.__client = redis.Redis(
-            host=redis_host.strip(), port=int(redis_port.strip())
-        )
+        # from_url also accepts a database index, e.g. redis://localhost:6379/1
+        self.__client = redis.Redis.from_url(REDIS_HOST)
 
-    def list_memory(self):
-        # store:* is the key format for memory store
-        # All other keys are langfuse keys
+        # In-process copy of the memories, valid for __snapshot_version
+        self.__lock = threading.Lock()
+        self.__snapshot: Optional[list] = None
+        self.__snapshot_version = 0
+        self.__latest_version = 0
+        self.__listener: Optional[threading.Thread] = None
+
+    def __scan_memory_keys(self) -> list[bytes]:
         return list(
-            map(
-                lambda key: self.__client.json().get(key, "$.value"),
-                list(self.__client.scan_iter("store:*")),
+            self.__client.scan_iter(MEMORY_KEY_PATTERN, count=MEMORY_SCAN_COUNT)
+        )
+
+    def __load_memories(self) -> list:
+        keys = self.__scan_memory_keys()
+
+        # One JSON.MGET round trip per batch instead of one JSON.GET per key
+        documents = []
+        for start in range(0, len(keys), MEMORY_FETCH_BATCH_SIZE):
+            documents.extend(
+                self.__client.json().mget(
+                    keys[start : start + MEMORY_FETCH_BATCH_SIZE], "$"
+                )
             )
+
+        # A key deleted between SCAN and MGET comes back empty
+        documents = [document[0] for document in documents if document]
+        # SCAN order is arbitrary, the prompts expect chronological order
+        documents.sort(key=lambda document: document.get("created_at", 0))
+        return [[document["value"]] for document in documents]
+
+    def __on_change(self, message: dict):
+        version = int(message["data"])
+        with self.__lock:
+            self.__latest_version = max(self.__latest_version, version)
+            # Our own write-through already holds this version
+            if version > self.__snapshot_version:
+                self.__snapshot = None
+
+    def __on_listener_error(self, error, pubsub, thread):
+        logger.error(f"Memory change listener stopped: {error}")
+        thread.stop()
+        pubsub.close()
+
+    def __ensure_listener(self) -> bool:
+        if self.__listener is not None and self.__listener.is_alive():
+            return True
+
+        # Changes made while nobody was listening are unknown, start over
+        with self.__lock:
+            self.__snapshot = None
+        try:
+            pubsub = self.__client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{MEMORY_CHANGES_CHANNEL: self.__on_change})
+            self.__listener = pubsub.run_in_thread(
+                sleep_time=1.0,
+                daemon=True,
+                exception_handler=self.__on_listener_error,
+            )
+            return True
+        except redis.RedisError as e:
+            logger.error(f"Failed to listen for memory changes: {e}")
+            return False
+
+    def __publish_change(self) -> int:
+        version = self.__client.incr(MEMORY_VERSION_KEY)
+        self.__client.publish(MEMORY_CHANGES_CHANNEL, version)
+        return version
+
+    def list_memory(self, refresh: bool = False):
+        listening = self.__ensure_listener()
+        if not listening:
+            # Without notifications a version check keeps the copy coherent
+            version = int(self.__client.get(MEMORY_VERSION_KEY) or 0)
+            with self.__lock:
+                self.__latest_version = max(self.__latest_version, version)
+                if version > self.__snapshot_version:
+                    self.__snapshot = None
+
+        with self.__lock:
+            if self.__snapshot is not None and not refresh:
+                return list(self.__snapshot)
+
+        # Read the version first, a change during the load makes it stale
+        version = int(self.__client.get(MEMORY_VERSION_KEY) or 0)
+        memories = self.__load_memories()
+        with self.__lock:
+            self.__latest_version = max(self.__latest_version, version)
+            if version == self.__latest_version:
+                self.__snapshot = memories
+                self.__snapshot_version = version
+        return list(memories)
+
+    def record_memory(self, memory: dict):
+        # Write-through after the memory agent's store.put, the snapshot is
+        # extended in place when no other change happened in between
+        version = self.__publish_change()
+        with self.__lock:
+            self.__latest_version = max(self.__latest_version, version)
+            if self.__snapshot is not None and self.__snapshot_version == version - 1:
+                self.__snapshot.append([memory])
+                self.__snapshot_version = version
+            else:
+                self.__snapshot = None
+
+    def invalidate_snapshot(self):
+        # For changes made directly on the langgraph store
+        version = self.__publish_change()
+        with self.__lock:
+            self.__latest_version = max(self.__latest_version, version)
+            self.__snapshot = None
+
+    def set_memory_created_at(
+        self, namespace: tuple[str, ...], key: str, created_at: datetime
+    ):
+        # langgraph's put always stamps the current time, in microseconds.
+        # Its documents live under random ids, the store's own index finds
+        # the one for this key in a single query
+        prefix = ".".join(namespace)
+        tag = TAG_SPECIAL_PATTERN.sub(lambda match: "\\" + match.group(), key)
+        query = (
+            Query(f"@key:{{{tag}}}")
+            .return_fields("prefix")
+            .paging(0, MEMORY_SCAN_COUNT)
         )
+        for document in self.__client.ft(MEMORY_INDEX).search(query).docs:
+            # The same key exists in every user's namespace
+            if document.prefix == prefix:
+                timestamp = int(created_at.timestamp() * 1_000_000)
+                self.__client.json().set(document.id, "$.created_at", timestamp)
+                return
+
+    def get_memory_history(self) -> dict[str, list[dict]]:
+        return self.__client.json().get(MEMORY_HISTORY_KEY) or {}
+
+    def append_memory_history(
+        self, entries: list[tuple[str, object, str]], max_entries: int
+    ):
+        # entries are (field, value, superseded at), newest kept per field
+        history = self.get_memory_history()
+        for field, value, superseded_at in entries:
+            history.setdefault(field, []).append(
+                {"value": value, "supersededAt": superseded_at}
+            )
+            history[field] = history[field][-max_entries:]
+        self.__client.json().set(MEMORY_HISTORY_KEY, "$", history)
 
     def delete_all_memory(self):
-        keys = list(self.__client.scan_iter("store:*"))
+        keys = self.__scan_memory_keys()
         if keys:
             self.__client.delete(*keys)
+        self.__client.delete(MEMORY_HISTORY_KEY)
+
+        version = self.__publish_change()
+        with self.__lock:
+            self.__latest_version = max(self.__latest_version, version)
+            self.__snapshot = []
+            self.__snapshot_version = version
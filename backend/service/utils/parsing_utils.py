@@ -5,6 +5,11 @@ import json
 logger = logging.getLogger(__name__)
 
 
+def estimate_tokens(text: str) -> int:
+    # Gemma averages about four characters per token on English text
+    return len(text) // 4 + 1
+
+
 def extract_memory_json(raw_memory_string: str) -> dict:
     try:
         if not raw_memory_string or raw_memory_string.strip() == "":
@@ -34,3 +39,24 @@ def extract_memory_json(raw_memory_string: str) -> dict:
         logger.error(f"Failed to parse JSON: {e}")
         logger.error(f"Raw content was: '{raw_memory_string}'")
         return {}
+
+
+def split_batch_memories(batch_memory: dict, batch_size: int) -> list[dict]:
+    # A batched extraction answers {"1": {...}, "2": {...}}, one entry per
+    # message in the order they were sent
+    if not isinstance(batch_memory, dict) or not batch_memory:
+        return []
+
+    numbered = {str(i) for i in range(1, batch_size + 1)}
+    if set(batch_memory) <= numbered and all(
+        isinstance(memory, dict) for memory in batch_memory.values()
+    ):
+        return [
+            batch_memory[str(i)]
+            for i in range(1, batch_size + 1)
+            if str(i) in batch_memory
+        ]
+
+    # The model merged every message into one object, keep it as one memory
+    logger.info("Batched memory extraction returned a single object")
+    return [batch_memory]
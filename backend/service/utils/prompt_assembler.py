@@ -0,0 +1,81 @@
+import threading
+import logging
+import json
+
+from service.utils.singleton import singleton
+from service.utils.prompt_store import SystemPromptStore
+from service.utils.user_info_store import UserInfoStore
+from service.utils.parsing_utils import estimate_tokens
+from service.utils.constants import (
+    PROMPT_SYSTEM_TOKEN_BUDGET,
+    PROMPT_PROFILE_TOKEN_BUDGET,
+    PROMPT_MEMORY_TOKEN_BUDGET,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def truncate_to_budget(text: str, token_budget: int, section: str) -> str:
+    if estimate_tokens(text) <= token_budget:
+        return text
+    logger.warning(f"Prompt section '{section}' exceeds {token_budget} tokens")
+    return text[: token_budget * 4]
+
+
+@singleton
+class PromptAssembler:
+    # Ollama reuses the KV cache of an identical prompt prefix, so the parts
+    # that rarely change come first and stay byte for byte the same
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__prefixes: dict[str, str] = {}
+
+    def invalidate(self):
+        # Called whenever a system prompt or the onboarding profile changes
+        with self.__lock:
+            self.__prefixes.clear()
+
+    def get_static_prefix(self, prompt_key: str) -> str:
+        with self.__lock:
+            prefix = self.__prefixes.get(prompt_key)
+        if prefix is not None:
+            return prefix
+
+        system_prompt = truncate_to_budget(
+            SystemPromptStore().get_prompt(key=prompt_key),
+            PROMPT_SYSTEM_TOKEN_BUDGET,
+            "system prompt",
+        )
+        user_details = UserInfoStore().get_user_document() or {}
+        user_details.pop("_id", None)
+        # Sorted keys, the same profile always serializes to the same bytes
+        stored_user_info = truncate_to_budget(
+            json.dumps(user_details, sort_keys=True),
+            PROMPT_PROFILE_TOKEN_BUDGET,
+            "user profile",
+        )
+        prefix = f"{system_prompt}\nHere are the details about the user stored when they onboarded: {stored_user_info}"
+
+        with self.__lock:
+            self.__prefixes[prompt_key] = prefix
+        return prefix
+
+    def assemble(
+        self, prompt_key: str, memory_info: str, tools: str = "", summary: str = ""
+    ) -> str:
+        # Tools change only with the frontend, the memories and the
+        # conversation summary change every turn and go last
+        sections = [self.get_static_prefix(prompt_key)]
+        if tools:
+            sections.append(tools)
+
+        memory_info = truncate_to_budget(
+            memory_info, PROMPT_MEMORY_TOKEN_BUDGET, "memories"
+        )
+        sections.append(
+            f"You are given a compressed information about previous conversation history in chronological order:\n\n{memory_info}."
+        )
+        if summary:
+            sections.append(f"Summary of the earlier conversation: {summary}")
+        return "\n".join(sections)
@@ -0,0 +1,117 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.__rate = rate
+        self.__capacity = capacity if capacity is not None else rate
+        self.__tokens = self.__capacity
+        self.__updated_at = time.monotonic()
+        self.__paused_until = 0.0
+
+    def __refill(self, now: float):
+        elapsed = now - self.__updated_at
+        self.__tokens = min(self.__capacity, self.__tokens + elapsed * self.__rate)
+        self.__updated_at = now
+
+    def pause(self, seconds: float):
+        # Honors Retry-After, nobody gets a token before the server is ready
+        self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+        self.__tokens = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.__paused_until:
+                await asyncio.sleep(self.__paused_until - now)
+                continue
+
+            self.__refill(now)
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.__tokens) / self.__rate)
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff_factor: float = 0.5,
+    ):
+        self.__limit = float(initial_limit)
+        self.__min_limit = min_limit
+        self.__max_limit = max_limit
+        self.__latency_target = latency_target
+        self.__backoff_factor = backoff_factor
+
+        self.__in_flight = 0
+        self.__last_backoff = 0.0
+        self.__condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self.__limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    async def __aenter__(self):
+        async with self.__condition:
+            await self.__condition.wait_for(lambda: self.__in_flight < self.limit)
+            self.__in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self.__condition:
+            self.__in_flight -= 1
+            self.__condition.notify_all()
+
+    def on_success(self, latency: float):
+        if latency > self.__latency_target:
+            self.on_congestion()
+            return
+
+        # Additive increase, roughly +1 per full window of successful requests
+        self.__limit = min(self.__max_limit, self.__limit + 1 / self.__limit)
+
+    def on_congestion(self):
+        # Every request of a congested window fails at once, back off once
+        # per latency target instead of collapsing straight to the minimum
+        now = time.monotonic()
+        if now - self.__last_backoff < self.__latency_target:
+            return
+
+        self.__last_backoff = now
+        previous = self.limit
+        self.__limit = max(self.__min_limit, self.__limit * self.__backoff_factor)
+        logger.info(f"Backing off tile download concurrency {previous} -> {self.limit}")
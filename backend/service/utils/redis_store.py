@@ -0,0 +1,30 @@
+from langgraph.store.redis import RedisStore
+import threading
+import logging
+import redis
+
+from service.utils.singleton import singleton
+from service.utils.environment import REDIS_HOST
+
+
+logger = logging.getLogger(__name__)
+
+
+@singleton
+class SharedRedisStore:
+    # One langgraph store and connection pool for every memory extraction,
+    # instead of a connection and index setup per message
+    def __init__(self):
+        self.__store = RedisStore(redis.Redis.from_url(REDIS_HOST))
+        self.__lock = threading.Lock()
+        self.__is_setup = False
+
+    def get_store(self) -> RedisStore:
+        # Indices are created lazily, Redis may not be up when agents start
+        if not self.__is_setup:
+            with self.__lock:
+                if not self.__is_setup:
+                    self.__store.setup()
+                    self.__is_setup = True
+                    logger.info("Redis memory store indices are ready")
+        return self.__store
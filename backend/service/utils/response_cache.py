@@ -0,0 +1,172 @@
+from typing import Optional
+import hashlib
+import logging
+import json
+import re
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from service.utils.environment import REDIS_HOST
+from service.utils.memory_retriever import TOKEN_PATTERN, tokenize
+from service.utils.constants import RESPONSE_CACHE_MIN_TOKENS
+
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_PREFIX = "response-cache"
+RESPONSE_CACHE_GENERATION_KEY = f"{RESPONSE_CACHE_PREFIX}:generation"
+# "don't" normalizes to "don t", the lone "t" is the negation
+NEGATIONS = {"not", "no", "never", "nor", "none", "nothing", "nobody", "cannot", "t"}
+# Words pointing back at earlier turns, "is it safe to..." is not one of them
+REFERENCES = {
+    "it", "its", "that", "this", "those", "these", "they", "them", "their",
+    "he", "she", "him", "her", "there", "again", "also", "else", "another",
+    "same", "above", "earlier", "previous", "instead",
+}  # fmt: skip
+DUMMY_IT_PATTERN = re.compile(r"\b(?:is|was|will|would) it\b|\bit (?:is|s|was)\b")
+FOLLOW_UP_PATTERN = re.compile(r"^(?:and|but|so|or|then|what about|how about)\b")
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Case, punctuation and spacing never change the answer
+    return " ".join(TOKEN_PATTERN.findall(prompt.lower()))
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+
+def _negations(normalized: str) -> set[str]:
+    return NEGATIONS.intersection(normalized.split())
+
+
+def is_standalone(normalized: str) -> bool:
+    # Answerable without the conversation before it, so the answer holds
+    # whatever was said earlier
+    if FOLLOW_UP_PATTERN.match(normalized):
+        return False
+    return not REFERENCES.intersection(DUMMY_IT_PATTERN.sub(" ", normalized).split())
+
+
+def _similarity(first: set[str], second: set[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class ResponseCache:
+    # Replays answers to questions already asked in the same disaster
+    # context. Entries are keyed by a generation number, so bumping it on a
+    # prompt change orphans every entry at once and the TTL cleans them up
+    def __init__(self, ttl: int, similarity: float, max_entries: int):
+        self.__client = redis.Redis.from_url(REDIS_HOST, decode_responses=True)
+        self.__ttl = ttl
+        self.__similarity = similarity
+        self.__max_entries = max_entries
+
+        self.__exact_hits = 0
+        self.__near_hits = 0
+        self.__misses = 0
+        self.__stores = 0
+        self.__invalidations = 0
+
+    async def __keys(self, context: str) -> tuple[str, str]:
+        generation = await self.__client.get(RESPONSE_CACHE_GENERATION_KEY) or "0"
+        base = f"{RESPONSE_CACHE_PREFIX}:{generation}:{_digest(context)}"
+        # (entry key prefix, near-duplicate index)
+        return f"{base}:entry", f"{base}:index"
+
+    def is_cacheable(self, prompt: str) -> bool:
+        # "yes", "what next?" or "is that safe?" mean something else at
+        # every turn
+        normalized = normalize_prompt(prompt)
+        return len(tokenize(normalized)) >= RESPONSE_CACHE_MIN_TOKENS and is_standalone(
+            normalized
+        )
+
+    async def get(self, prompt: str, context: str) -> Optional[list[str]]:
+        # Never raises, a cache failure only costs a generation
+        normalized = normalize_prompt(prompt)
+        try:
+            entry_prefix, index_key = await self.__keys(context)
+            entry_id = _digest(normalized)
+            cached = await self.__client.get(f"{entry_prefix}:{entry_id}")
+            if cached is not None:
+                self.__exact_hits += 1
+                return json.loads(cached)
+
+            best_id, best_score = None, 0.0
+            tokens = set(tokenize(normalized))
+            negations = _negations(normalized)
+            for candidate_id, candidate in (
+                await self.__client.hgetall(index_key)
+            ).items():
+                # One "not" turns the answer around, however similar the rest
+                if _negations(candidate) != negations:
+                    continue
+                score = _similarity(tokens, set(tokenize(candidate)))
+                if score > best_score:
+                    best_id, best_score = candidate_id, score
+
+            if best_id is not None and best_score >= self.__similarity:
+                cached = await self.__client.get(f"{entry_prefix}:{best_id}")
+                if cached is not None:
+                    self.__near_hits += 1
+                    logger.info(f"Near-duplicate response cache hit ({best_score:.2f})")
+                    return json.loads(cached)
+                # Expired, drop it from the index
+                await self.__client.hdel(index_key, best_id)
+        except RedisError as e:
+            logger.error(f"Failed to read the response cache: {e}")
+
+        self.__misses += 1
+        return None
+
+    async def put(self, prompt: str, context: str, chunks: list[str]):
+        normalized = normalize_prompt(prompt)
+        if not self.is_cacheable(prompt) or not "".join(chunks).strip():
+            return
+
+        try:
+            entry_prefix, index_key = await self.__keys(context)
+            entry_id = _digest(normalized)
+            async with self.__client.pipeline(transaction=False) as pipeline:
+                pipeline.set(
+                    f"{entry_prefix}:{entry_id}", json.dumps(chunks), ex=self.__ttl
+                )
+                pipeline.hlen(index_key)
+                _, indexed = await pipeline.execute()
+
+            # Past the cap, new answers still hit exactly but are no longer
+            # compared against, which bounds the scan on every lookup
+            if indexed < self.__max_entries:
+                async with self.__client.pipeline(transaction=False) as pipeline:
+                    pipeline.hset(index_key, entry_id, normalized)
+                    pipeline.expire(index_key, self.__ttl)
+                    await pipeline.execute()
+            self.__stores += 1
+        except RedisError as e:
+            logger.error(f"Failed to write the response cache: {e}")
+
+    async def invalidate(self):
+        try:
+            await self.__client.incr(RESPONSE_CACHE_GENERATION_KEY)
+            self.__invalidations += 1
+            logger.info("Response cache invalidated")
+        except RedisError as e:
+            logger.error(f"Failed to invalidate the response cache: {e}")
+
+    def stats(self) -> dict:
+        hits = self.__exact_hits + self.__near_hits
+        lookups = hits + self.__misses
+        return {
+            "exactHits": self.__exact_hits,
+            "nearHits": self.__near_hits,
+            "misses": self.__misses,
+            "hitRate": round(hits / lookups, 3) if lookups else 0,
+            "stores": self.__stores,
+            "invalidations": self.__invalidations,
+        }
+
+    async def close(self):
+        await self.__client.aclose()
@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+import sqlite3
+import threading
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteConnectionPool:
+    def __init__(
+        self,
+        db_name: str,
+        pragmas: dict[str, str | int],
+        setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+    ):
+        self.__db_name = db_name
+        self.__pragmas = pragmas
+        self.__setup = setup
+
+        # Readers are per-thread, the writer is shared and serialised by a lock
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.RLock()
+        self.__writer: Optional[sqlite3.Connection] = None
+        self.__generation = 0
+
+    @property
+    def db_name(self) -> str:
+        return self.__db_name
+
+    def __connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.__db_name, check_same_thread=False, timeout=30)
+        for pragma, value in self.__pragmas.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        return conn
+
+    def __ensure_writer(self) -> sqlite3.Connection:
+        with self.__lock:
+            if self.__writer is None:
+                conn = self.__connect()
+                conn.execute("PRAGMA journal_mode=WAL")
+                if self.__setup is not None:
+                    with conn:
+                        self.__setup(conn)
+                self.__writer = conn
+                logger.info(f"Opened writer connection to '{self.__db_name}'")
+            return self.__writer
+
+    def reader(self) -> sqlite3.Connection:
+        # Make sure the schema and WAL journal exist before any reader opens
+        self.__ensure_writer()
+
+        cached = getattr(self.__local, "conn", None)
+        if cached is not None:
+            generation, conn = cached
+            if generation == self.__generation:
+                return conn
+            # Retired by close(), only the owning thread may close it
+            conn.close()
+
+        conn = self.__connect()
+        conn.execute("PRAGMA query_only=ON")
+        self.__local.conn = (self.__generation, conn)
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        conn = self.__ensure_writer()
+        with self.__write_lock:
+            with conn:
+                yield conn
+
+    def close(self):
+        # Readers belong to their threads and may be in the middle of a
+        # query, they are only retired here. Each thread closes its own on
+        # the next reader() call, the connection of a thread that never
+        # comes back is closed when the thread exits
+        with self.__write_lock, self.__lock:
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
+
+            self.__generation += 1
+
+    def delete(self):
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            path = f"{self.__db_name}{suffix}"
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import Optional
+import threading
+
+
+TileKey = tuple[int, int, int]
+# (hash, data), the hash doubles as the tile's ETag
+CachedTile = tuple[str, bytes]
+
+
+class TileCache:
+    def __init__(self, max_bytes: int):
+        self.__max_bytes = max_bytes
+        self.__tiles: OrderedDict[TileKey, CachedTile] = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+        # Bumped by every invalidation, a fill read from the database before
+        # a write committed must not land after that write invalidated it
+        self.__generation = 0
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__stale_fills = 0
+
+    @property
+    def generation(self) -> int:
+        return self.__generation
+
+    def get(self, z: int, x: int, y: int) -> Optional[CachedTile]:
+        key = (z, x, y)
+        with self.__lock:
+            tile = self.__tiles.get(key)
+            if tile is None:
+                self.__misses += 1
+                return None
+
+            self.__tiles.move_to_end(key)
+            self.__hits += 1
+            return tile
+
+    def put(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        tile_hash: str,
+        tile_data: bytes,
+        generation: Optional[int] = None,
+    ):
+        # Tiles bigger than the whole budget would only evict everything else
+        if len(tile_data) > self.__max_bytes:
+            return
+
+        key = (z, x, y)
+        with self.__lock:
+            if generation is not None and generation != self.__generation:
+                self.__stale_fills += 1
+                return
+
+            previous = self.__tiles.pop(key, None)
+            if previous is not None:
+                self.__size -= len(previous[1])
+
+            self.__tiles[key] = (tile_hash, tile_data)
+            self.__size += len(tile_data)
+
+            while self.__size > self.__max_bytes:
+                _, (_, evicted) = self.__tiles.popitem(last=False)
+                self.__size -= len(evicted)
+                self.__evictions += 1
+
+    def invalidate(self, z: int, x: int, y: int):
+        with self.__lock:
+            self.__generation += 1
+            tile = self.__tiles.pop((z, x, y), None)
+            if tile is not None:
+                self.__size -= len(tile[1])
+
+    def clear(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__tiles.clear()
+            self.__size = 0
+
+    def stats(self) -> dict:
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "staleFills": self.__stale_fills,
+                "hitRate": round(self.__hits / lookups, 4) if lookups else 0.0,
+                "tiles": len(self.__tiles),
+                "bytes": self.__size,
+                "maxBytes": self.__max_bytes,
+            }
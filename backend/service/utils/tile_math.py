@@ -0,0 +1,64 @@
+import math
+
+
+# 1 degree lat = 69.0 miles
+MILES_PER_DEGREE = 69.0
+
+
+def deg2num(lat_deg: float, lon_deg: float, zoom: int) -> tuple[int, int]:
+    lat_radians = math.radians(lat_deg)
+    n = 2.0**zoom
+    x = int((lon_deg + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_radians)) / math.pi) / 2.0 * n)
+    return (x, y)
+
+
+def num2deg(x: int, y: int, zoom: int) -> tuple[float, float]:
+    # North-west corner of the tile
+    n = 2.0**zoom
+    lon_deg = x / n * 360.0 - 180.0
+    lat_deg = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return (lat_deg, lon_deg)
+
+
+def calculate_bounds(
+    center_lat: float, center_lon: float, radius_miles: float, zoom: int
+) -> tuple[int, int, int, int]:
+    lat_offset = radius_miles / MILES_PER_DEGREE
+    lon_offset = radius_miles / (MILES_PER_DEGREE * math.cos(math.radians(center_lat)))
+
+    north = center_lat + lat_offset
+    south = center_lat - lat_offset
+    east = center_lon + lon_offset
+    west = center_lon - lon_offset
+
+    x_min, y_min = deg2num(north, west, zoom)
+    x_max, y_max = deg2num(south, east, zoom)
+
+    return (x_min, y_min, x_max, y_max)
+
+
+def tile_distance_miles(
+    center_lat: float, center_lon: float, z: int, x: int, y: int
+) -> float:
+    # Distance from the center to the closest point of the tile, 0 if inside
+    north, west = num2deg(x, y, z)
+    south, east = num2deg(x + 1, y + 1, z)
+
+    closest_lat = min(max(center_lat, south), north)
+    closest_lon = min(max(center_lon, west), east)
+
+    dlat = (closest_lat - center_lat) * MILES_PER_DEGREE
+    dlon = (
+        (closest_lon - center_lon)
+        * MILES_PER_DEGREE
+        * math.cos(math.radians(center_lat))
+    )
+    return math.hypot(dlat, dlon)
+
+
+def tile_box(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    # (north, south, west, east) in degrees
+    north, west = num2deg(x, y, z)
+    south, east = num2deg(x + 1, y + 1, z)
+    return (north, south, west, east)
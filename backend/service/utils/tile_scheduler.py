@@ -0,0 +1,119 @@
+from typing import Optional
+
+from service.utils.tile_math import calculate_bounds, tile_box, tile_distance_miles
+from service.utils.map_areas import MapArea, cover_tiles
+from service.utils.constants import (
+    CACHED_MAP_RING_WIDTH,
+    CACHED_MAP_PREFERRED_ZOOM_LEVEL,
+)
+
+
+# (ring, z, x, y), ring 0 is the one holding the center point
+PlannedTile = tuple[int, int, int, int]
+
+# Ring of tiles that only belong to extra areas, they never count towards
+# the coverage radius around the user
+EXTRA_AREA_RING = -1
+
+
+class TileScheduler:
+    def __init__(
+        self,
+        center_lat: float,
+        center_lon: float,
+        radius_miles: float,
+        min_zoom: int,
+        max_zoom: int,
+        ring_width_miles: float = CACHED_MAP_RING_WIDTH,
+        preferred_zoom: int = CACHED_MAP_PREFERRED_ZOOM_LEVEL,
+        extra_areas: Optional[list[MapArea]] = None,
+    ):
+        self.__radius_miles = float(radius_miles)
+        self.__ring_width = ring_width_miles
+
+        self.bounds: dict[int, tuple[int, int, int, int]] = {}
+
+        planned = []
+        for zoom in range(min_zoom, max_zoom + 1):
+            x_min, y_min, x_max, y_max = calculate_bounds(
+                center_lat, center_lon, radius_miles, zoom
+            )
+            self.bounds[zoom] = (x_min, y_min, x_max, y_max)
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    distance = tile_distance_miles(center_lat, center_lon, zoom, x, y)
+                    ring = int(distance // ring_width_miles)
+                    planned.append(
+                        (ring, abs(zoom - preferred_zoom), distance, zoom, x, y)
+                    )
+
+        # Inner rings at every zoom first, then the most useful zooms, then
+        # the tiles closest to the center
+        planned.sort()
+        self.tiles: list[PlannedTile] = [
+            (ring, zoom, x, y) for ring, _, _, zoom, x, y in planned
+        ]
+
+        # Extra areas come after the user's own area, in the order they were
+        # queued. A tile shared by several areas is planned only once.
+        seen = {(zoom, x, y) for _, zoom, x, y in self.tiles}
+        for area in extra_areas or []:
+            area_planned = []
+            for zoom, x, y in cover_tiles(area, min_zoom, max_zoom):
+                if (zoom, x, y) in seen:
+                    continue
+                seen.add((zoom, x, y))
+
+                distance = area.distance_from_anchor(tile_box(zoom, x, y))
+                ring = int(distance // ring_width_miles)
+                area_planned.append(
+                    (ring, abs(zoom - preferred_zoom), distance, zoom, x, y)
+                )
+
+                x_min, y_min, x_max, y_max = self.bounds[zoom]
+                self.bounds[zoom] = (
+                    min(x_min, x),
+                    min(y_min, y),
+                    max(x_max, x),
+                    max(y_max, y),
+                )
+
+            area_planned.sort()
+            self.tiles.extend(
+                (EXTRA_AREA_RING, zoom, x, y) for _, _, _, zoom, x, y in area_planned
+            )
+
+        self.__pending_per_ring: dict[int, int] = {}
+        for ring, _, _, _ in self.tiles:
+            if ring == EXTRA_AREA_RING:
+                continue
+            self.__pending_per_ring[ring] = self.__pending_per_ring.get(ring, 0) + 1
+        self.__first_incomplete_ring = 0
+        self.__advance()
+
+    def __advance(self):
+        while self.__pending_per_ring.get(self.__first_incomplete_ring, 0) == 0:
+            if self.__first_incomplete_ring > max(self.__pending_per_ring, default=0):
+                break
+            self.__first_incomplete_ring += 1
+
+    def mark_complete(self, tile: PlannedTile):
+        ring = tile[0]
+        if ring == EXTRA_AREA_RING:
+            return
+        self.__pending_per_ring[ring] -= 1
+        self.__advance()
+
+    @property
+    def coverage_radius(self) -> float:
+        # Every tile at every zoom within this many miles has been cached
+        if self.__first_incomplete_ring > max(self.__pending_per_ring, default=-1):
+            # Past the last ring, the ring edge may fall short of the radius
+            return self.__radius_miles
+        return round(
+            min(self.__first_incomplete_ring * self.__ring_width, self.__radius_miles),
+            2,
+        )
+
+    def __len__(self) -> int:
+        return len(self.tiles)
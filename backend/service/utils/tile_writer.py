@@ -0,0 +1,132 @@
+from typing import Callable, Optional
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from service.utils.map_store import MapStore
+from service.utils.constants import (
+    TILE_WRITER_QUEUE_SIZE,
+    TILE_WRITER_BATCH_SIZE,
+    TILE_WRITER_FLUSH_INTERVAL,
+    TILE_WRITER_FULL_POLL_INTERVAL,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+_STOP = object()
+
+
+class TileWriterError(Exception):
+    # The map store refused a batch, disk full or a locked database. Not
+    # the tiles' fault, the download is retried as a whole later
+    pass
+
+
+class TileWriter:
+    def __init__(
+        self,
+        map_store: MapStore,
+        queue_size: int = TILE_WRITER_QUEUE_SIZE,
+        batch_size: int = TILE_WRITER_BATCH_SIZE,
+        flush_interval: float = TILE_WRITER_FLUSH_INTERVAL,
+        on_flush: Optional[Callable[[list[tuple[int, int, int]]], None]] = None,
+    ):
+        self.__map_store = map_store
+        self.__queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__on_flush = on_flush
+
+        self.__thread: Optional[threading.Thread] = None
+        self.__error: Optional[Exception] = None
+        self.tiles_written = 0
+        self.batches_written = 0
+
+    @property
+    def error(self) -> Optional[Exception]:
+        return self.__error
+
+    def start(self):
+        self.__thread = threading.Thread(
+            target=self.__run, name="tile-writer", daemon=True
+        )
+        self.__thread.start()
+
+    async def __enqueue(self, item):
+        # Backpressure: poll until the writer catches up. A blocking put in a
+        # worker thread could not be cancelled and would hold the thread
+        # forever if the writer never drained the queue
+        while True:
+            try:
+                self.__queue.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(TILE_WRITER_FULL_POLL_INTERVAL)
+
+    def raise_if_failed(self):
+        if self.__error is not None:
+            raise TileWriterError(
+                f"Failed to write tiles: {self.__error}"
+            ) from self.__error
+
+    async def put(self, z: int, x: int, y: int, tile_data: bytes):
+        self.raise_if_failed()
+
+        await self.__enqueue((z, x, y, tile_data))
+
+    async def close(self):
+        if self.__thread is None:
+            return
+
+        await self.__enqueue(_STOP)
+        await asyncio.to_thread(self.__thread.join)
+        self.__thread = None
+
+        logger.info(
+            f"Tile writer stopped after {self.tiles_written} tiles in {self.batches_written} batches"
+        )
+
+    def __flush(self, batch: list[tuple[int, int, int, bytes]]):
+        if not batch:
+            return
+
+        try:
+            self.__map_store.store_tiles(batch)
+            self.tiles_written += len(batch)
+            self.batches_written += 1
+            if self.__on_flush is not None:
+                self.__on_flush([(z, x, y) for z, x, y, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to write batch of {len(batch)} tiles: {e}")
+            self.__error = e
+
+    def __run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.__queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self.__flush(batch)
+                return
+
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.__flush_interval
+                batch.append(item)
+
+            if len(batch) >= self.__batch_size or (
+                batch and time.monotonic() >= deadline
+            ):
+                self.__flush(batch)
+                batch = []
+                deadline = None
@@ -0,0 +1,45 @@
+from typing import Optional
+import time
+
+
+class TurnTimings:
+    # Wall clock breakdown of a single generation turn, in seconds
+    def __init__(self):
+        self.__started_at = time.perf_counter()
+        self.context_fetch: Optional[float] = None
+        self.prompt_build: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.total: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.__started_at
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = self.elapsed()
+
+    def finish(self):
+        self.total = self.elapsed()
+
+    def __durations(self) -> dict[str, Optional[float]]:
+        return {
+            "context": self.context_fetch,
+            "prompt": self.prompt_build,
+            "ttft": self.first_token,
+            "total": self.total,
+        }
+
+    def server_timing(self) -> str:
+        # Server-Timing header value, durations in milliseconds
+        return ", ".join(
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in self.__durations().items()
+            if duration is not None
+        )
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name}={duration:.3f}s"
+            for name, duration in self.__durations().items()
+            if duration is not None
+        )
@@ -1,3 +1,4 @@
+from typing import Optional
 import pymongo
 
 from service.utils.singleton import singleton
@@ -22,6 +23,10 @@ class UserInfoStore:
     def get_user_document(self):
         return self.__collection.find_one({})
 
+    def get_user_id(self) -> Optional[str]:
+        user = self.__collection.find_one({}, projection={"_id": 1})
+        return str(user["_id"]) if user else None
+
     def onboard_user(self, onboarding_request: OnboardingRequest):
         self.__collection.insert_one(onboarding_request.model_dump(mode="json"))
 
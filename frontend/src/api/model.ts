@@ -64,6 +64,7 @@ export interface DisasterContext {
 
 export interface GetMapDownloadStatus {
   downloadStatus: number;
+  coverageRadius: number;
 }
 
 export interface GetChecklistResponse {
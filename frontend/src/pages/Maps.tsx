@@ -57,6 +57,12 @@ const Maps: React.FC = () => {
               Map Cached Percent:{" "}
               {loading ? "loading..." : `${mapDownloadStatus?.downloadStatus}%`}
             </p>
+            <p>
+              Offline Coverage Radius:{" "}
+              {loading
+                ? "loading..."
+                : `${mapDownloadStatus?.coverageRadius} miles`}
+            </p>
             <LocationMap
               latitude={userDetails.location.latitude.toString()}
               longitude={userDetails.location.longitude.toString()}